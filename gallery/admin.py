@@ -8,7 +8,7 @@ class ImageInline(admin.TabularInline):
     extra = 5 #number of default empty fields to show
 
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name']
+    list_display = ['name', 'image_count', 'images_updated_at']
     inlines = [ImageInline]
 
 class ImageAdmin(admin.ModelAdmin):
@@ -0,0 +1,304 @@
+"""
+Data derived from gallery photos, e.g. their dimensions, the inline
+placeholders shown while thumbnails load, the perceptual hashes used to
+find duplicates and the colour palettes visitors can browse by.
+
+Each analysis is a function registered with @analysis, taking a Photo and
+returning a dict of Image field values.  All of them are run together,
+from a single decode of the photo, whenever an image's photo changes (see
+Image.save and gallery.importer); the backfill_gallery_images command runs
+them for existing images, across a pool of worker processes.
+"""
+import base64
+import colorsys
+import logging
+import multiprocessing
+
+from collections import OrderedDict, namedtuple
+from io import BytesIO
+
+from django.db import transaction
+from django.db.models import Q
+
+from PIL import Image as PILImage
+
+
+logger = logging.getLogger(__name__)
+
+# longest side of the reduced copy of the photo that analyses work from
+WORKING_SIZE = 256
+# longest side of the inline placeholders
+PLACEHOLDER_SIZE = 20
+# perceptual hashes are HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 8
+# number of colours in each photo's stored palette, and the longest side of
+# the copy they're picked from
+PALETTE_SIZE = 5
+PALETTE_SAMPLE_SIZE = 64
+# the named colours photos are browsed by, e.g. for the colour filter
+COLOUR_NAMES = (
+    'red', 'orange', 'yellow', 'green', 'blue', 'purple', 'pink', 'brown',
+    'black', 'grey', 'white',
+)
+
+Analysis = namedtuple('Analysis', 'name fields missing func')
+
+# name: Analysis, in the order they are run
+ANALYSES = OrderedDict()
+
+
+def analysis(name, fields, missing):
+    """
+    Register an analysis.  `fields` are the Image fields it sets and
+    `missing` a Q matching images that haven't had it yet.
+    """
+    def decorator(func):
+        ANALYSES[name] = Analysis(name, fields, missing, func)
+        return func
+    return decorator
+
+
+class Photo(object):
+    """
+    A photo file opened for analysis.  `width`, `height` and `file_size`
+    are those of the file; `small` is an RGB copy no larger than
+    WORKING_SIZE, decoded at reduced scale where the format allows it, so
+    large photos are never fully decoded.
+    """
+
+    def __init__(self, file, file_size):
+        image = PILImage.open(file)
+        self.width, self.height = image.size
+        self.file_size = file_size
+        image.draft('RGB', (WORKING_SIZE, WORKING_SIZE))
+        if image.mode in ('RGBA', 'LA') or \
+                (image.mode == 'P' and 'transparency' in image.info):
+            # flatten any transparency onto white
+            image = image.convert('RGBA')
+            background = PILImage.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.split()[3])
+            image = background
+        image = image.convert('RGB')
+        image.thumbnail((WORKING_SIZE, WORKING_SIZE), PILImage.ANTIALIAS)
+        self.small = image
+
+
+@analysis(
+    'dimensions', fields=('width', 'height', 'file_size', 'aspect_ratio'),
+    missing=Q(width__isnull=True)
+)
+def measure(photo):
+    """
+    The photo's size, so pages and the api never need to open the file for
+    it
+    """
+    return {
+        'width': photo.width,
+        'height': photo.height,
+        'file_size': photo.file_size,
+        'aspect_ratio': photo.width / photo.height,
+    }
+
+
+@analysis('placeholder', fields=('placeholder',), missing=Q(placeholder=''))
+def make_placeholder(photo):
+    """
+    A tiny, blurry JPEG of the photo as a data uri, to inline in pages
+    """
+    image = photo.small.copy()
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), PILImage.ANTIALIAS)
+    output = BytesIO()
+    image.save(output, format='JPEG', quality=40)
+    return {
+        'placeholder': 'data:image/jpeg;base64,{}'.format(
+            base64.b64encode(output.getvalue()).decode('ascii')
+        )
+    }
+
+
+@analysis('phash', fields=('phash',), missing=Q(phash=''))
+def difference_hash(photo):
+    """
+    64 bit difference hash (dHash) of the photo, as 16 hex digits: one bit
+    per pair of horizontally adjacent pixels of a tiny greyscale copy, set
+    if the left one is brighter.  Resized, recompressed or slightly edited
+    copies of a photo have hashes only a few bits apart (see
+    gallery.duplicates).
+    """
+    image = photo.small.convert('L').resize(
+        (HASH_SIZE + 1, HASH_SIZE), PILImage.ANTIALIAS
+    )
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        row_pixels = pixels[row * (HASH_SIZE + 1):(row + 1) * (HASH_SIZE + 1)]
+        for left, right in zip(row_pixels, row_pixels[1:]):
+            value = value << 1 | (left > right)
+    return {'phash': '{:0{}x}'.format(value, HASH_SIZE * HASH_SIZE // 4)}
+
+
+def colour_name(rgb):
+    """
+    The nearest of COLOUR_NAMES to an (r, g, b) colour
+    """
+    hue, saturation, value = colorsys.rgb_to_hsv(
+        *[component / 255 for component in rgb]
+    )
+    hue *= 360
+    if value < 0.2:
+        return 'black'
+    if saturation < 0.15:
+        return 'white' if value > 0.85 else 'grey'
+    if hue < 45 or hue >= 345:
+        if value < 0.6:
+            return 'brown'
+        return 'red' if hue < 15 or hue >= 345 else 'orange'
+    if hue < 70:
+        return 'yellow'
+    if hue < 170:
+        return 'green'
+    if hue < 260:
+        return 'blue'
+    if hue < 290:
+        return 'purple'
+    return 'pink'
+
+
+@analysis(
+    'palette', fields=('palette', 'colour'), missing=Q(palette='')
+)
+def extract_palette(photo):
+    """
+    The photo's PALETTE_SIZE main colours, most common first, as
+    comma separated hex values, and the name of the most common one (see
+    COLOUR_NAMES).  Picked by median cut, from a copy small enough that
+    this costs about as much as the placeholder.
+    """
+    image = photo.small.copy()
+    image.thumbnail(
+        (PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE), PILImage.ANTIALIAS
+    )
+    quantized = image.quantize(colors=PALETTE_SIZE)
+    palette = quantized.getpalette()
+    colours = [
+        tuple(palette[index * 3:index * 3 + 3])
+        for _, index in sorted(quantized.getcolors(), reverse=True)
+    ]
+    return {
+        'palette': ','.join(
+            '#{:02x}{:02x}{:02x}'.format(*colour) for colour in colours
+        ),
+        'colour': colour_name(colours[0]),
+    }
+
+
+def analyse(file, file_size, only=None):
+    """
+    Run the analyses named in `only` (default all) on an image file, and
+    return the Image field values they set
+    """
+    photo = Photo(file, file_size)
+    values = {}
+    for name, registered in ANALYSES.items():
+        if only is None or name in only:
+            values.update(registered.func(photo))
+    return values
+
+
+def _photo_storage():
+    from gallery.models import Image
+    return Image._meta.get_field('photo').storage
+
+
+def analyse_image(image, only=None):
+    """
+    Analyse an image's photo, returning the field values, or an empty dict
+    if the photo can't be read
+    """
+    if not image.photo:
+        return {}
+    try:
+        storage = _photo_storage()
+        with storage.open(image.photo.name) as file:
+            return analyse(file, storage.size(image.photo.name), only)
+    except Exception as e:  # never let analysis break saving the image
+        logger.warning(
+            'Could not analyse image %s (%s): %s', image.id,
+            image.photo.name, e
+        )
+        return {}
+
+
+def _analyse_stored(args):
+    """
+    Analyse a stored photo; runs in the backfill pool's worker processes,
+    which only read files.  Returns (image id, values, error).
+    """
+    image_id, name, only = args
+    try:
+        storage = _photo_storage()
+        with storage.open(name) as file:
+            return image_id, analyse(file, storage.size(name), only), None
+    except Exception as e:  # a bad photo mustn't abort the backfill
+        return image_id, {}, str(e) or repr(e)
+
+
+def backfill(only=None, redo=False, processes=None, batch_size=100):
+    """
+    Run analyses on existing images: those that haven't had them yet, or
+    every image with a photo if `redo`.  Photos are analysed across
+    `processes` worker processes (default the number of cpus), and the
+    results saved in batches.  Returns (images updated, images failed).
+    """
+    from gallery.cache import invalidate_pages
+    from gallery.duplicates import invalidate_index
+    from gallery.models import Category, Image
+
+    only = list(only or ANALYSES)
+    images = Image.objects.exclude(photo='').exclude(photo__isnull=True)
+    if not redo:
+        missing = Q()
+        for name in only:
+            missing |= ANALYSES[name].missing
+        images = images.filter(missing)
+
+    updated = failed = 0
+    last_id = 0
+    processes = processes or multiprocessing.cpu_count()
+    # the pool's workers only read files, all db access is in this process
+    with multiprocessing.Pool(processes) as pool:
+        while True:
+            batch = list(
+                images.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'photo', 'category_id')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            image_categories = {
+                image_id: category_id for image_id, _, category_id in batch
+            }
+            category_ids = set()
+
+            results = pool.imap_unordered(
+                _analyse_stored,
+                [(image_id, name, only) for image_id, name, _ in batch]
+            )
+            with transaction.atomic():
+                for image_id, values, error in results:
+                    if error:
+                        logger.warning(
+                            'Could not analyse image %s: %s', image_id, error
+                        )
+                        failed += 1
+                        continue
+                    Image.objects.filter(id=image_id).update(**values)
+                    category_ids.add(image_categories[image_id])
+                    updated += 1
+                # the albums' ETags go by images_updated_at
+                Category.objects.filter(id__in=category_ids).images_changed()
+                invalidate_pages(category_ids)
+                if category_ids and 'phash' in only:
+                    # existing images' hashes have changed
+                    invalidate_index()
+    return updated, failed
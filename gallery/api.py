@@ -0,0 +1,216 @@
+"""
+Read-only JSON API for the gallery: the album list, an album with a page of
+its images, and single images, under /gallery/api/v1/.
+
+Responses are built straight from values() queries rather than model forms
+or full model instances.  Consumers can ask for just the fields they need
+with `fields[album]` and `fields[image]` (comma separated), which also
+skips building rendition urls if they aren't wanted.  Each response has an
+ETag made from the cached page versions (see gallery.cache), so conditional
+requests cost no database queries beyond looking the album up, and a
+Cache-Control max-age of settings.GALLERY_API_MAX_AGE.
+"""
+import hashlib
+
+from functools import wraps
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.http import Http404, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+
+from gallery.cache import cache_page_by_version, category_scope, \
+    category_scopes, get_versions, menu_scopes
+from gallery.imagegenerators import RENDITIONS
+from gallery.models import Category, Image
+from gallery.pagination import InvalidCursor, paginate_images
+
+
+VERSION = 'v1'
+
+ALBUM_FIELDS = (
+    'id', 'slug', 'name', 'description', 'image_count', 'updated_at', 'url',
+)
+IMAGE_FIELDS = (
+    'id', 'album', 'caption', 'width', 'height', 'file_size',
+    'aspect_ratio', 'placeholder', 'palette', 'colour', 'renditions',
+    'sources',
+)
+# model fields the album and image fields are made from
+ALBUM_COLUMNS = ('id', 'slug', 'name', 'description', 'image_count',
+                 'updated_at', 'images_updated_at')
+IMAGE_COLUMNS = ('id', 'category_id', 'photo', 'caption', 'width', 'height',
+                 'file_size', 'aspect_ratio', 'placeholder', 'palette',
+                 'colour')
+
+
+def _requested_fields(request, kind, available):
+    """
+    The fields asked for with `fields[kind]`, or all of them
+    """
+    requested = request.GET.get('fields[{}]'.format(kind))
+    if not requested:
+        return available
+    requested = set(requested.split(','))
+    return [field for field in available if field in requested]
+
+
+def serialize_album(request, values, fields):
+    album = {}
+    for field in fields:
+        if field == 'url':
+            album['url'] = request.build_absolute_uri(
+                reverse('gallery:api_album', args=[values['slug']])
+            )
+        elif field == 'updated_at':
+            # the later of the album's own changes and its images'
+            album['updated_at'] = max(
+                filter(None, [values['updated_at'],
+                              values['images_updated_at']])
+            )
+        else:
+            album[field] = values[field]
+    return album
+
+
+def serialize_image(request, values, fields):
+    image = {}
+    instance = None
+    if 'renditions' in fields or 'sources' in fields:
+        # just enough of an Image to generate rendition urls from
+        instance = Image(
+            id=values['id'], category_id=values['category_id'],
+            photo=values['photo'], width=values['width'],
+            height=values['height']
+        )
+    for field in fields:
+        if field == 'album':
+            image['album'] = values['category_id']
+        elif field == 'renditions':
+            image['renditions'] = {}
+            for name, _ in RENDITIONS:
+                url = instance.rendition_url(name)
+                size = instance.rendition_size(name)
+                image['renditions'][name] = {
+                    'url': request.build_absolute_uri(url) if url else '',
+                    'width': size[0] if size else None,
+                    'height': size[1] if size else None,
+                }
+        elif field == 'sources':
+            image['sources'] = {
+                name: [
+                    {'type': mime_type,
+                     'url': request.build_absolute_uri(url)}
+                    for mime_type, url in instance.rendition_sources(name)
+                ]
+                for name, _ in RENDITIONS
+            }
+        elif field in ('width', 'height', 'file_size', 'aspect_ratio'):
+            image[field] = values[field]  # None until the photo is measured
+        else:
+            image[field] = values[field] or ''
+    return image
+
+
+def _image_scopes(request, pk):
+    if not hasattr(request, '_gallery_api_image_category'):
+        request._gallery_api_image_category = Image.objects.filter(
+            pk=pk
+        ).values_list('category_id', flat=True).first()
+    category_id = request._gallery_api_image_category
+    if category_id is None:
+        return None
+    return [category_scope(category_id)]
+
+
+def _etag(get_scopes):
+    def etag_func(request, *args, **kwargs):
+        scopes = get_scopes(request, *args, **kwargs)
+        if scopes is None:
+            return None
+        versions = get_versions(scopes)
+        return hashlib.md5(
+            '{}:{}:{}'.format(
+                VERSION, request.get_full_path(),
+                '.'.join(str(version) for version in versions)
+            ).encode()
+        ).hexdigest()
+    return etag_func
+
+
+def api_view(get_scopes):
+    """
+    Decorator for the API views: GET/HEAD only, ETags and page caching by
+    the versions of `get_scopes`, and a public Cache-Control max-age
+    """
+    def decorator(view):
+        @require_safe
+        @condition(etag_func=_etag(get_scopes))
+        @cache_page_by_version(get_scopes)
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            patch_cache_control(
+                response, public=True, max_age=settings.GALLERY_API_MAX_AGE
+            )
+            return response
+        return wrapped
+    return decorator
+
+
+@api_view(menu_scopes)
+def album_list(request):
+    fields = _requested_fields(request, 'album', ALBUM_FIELDS)
+    albums = Category.objects.order_by('name').values(*ALBUM_COLUMNS)
+    return JsonResponse(
+        {'albums': [serialize_album(request, album, fields)
+                    for album in albums]}
+    )
+
+
+@api_view(category_scopes)
+def album_detail(request, slug):
+    """
+    An album, with a page of its images; `next` is the url of the next page
+    """
+    album = Category.objects.filter(slug=slug).values(*ALBUM_COLUMNS).first()
+    if album is None:
+        raise Http404
+    try:
+        page = paginate_images(
+            Image.objects.filter(category_id=album['id'])
+            .values(*IMAGE_COLUMNS),
+            request.GET.get('after')
+        )
+    except InvalidCursor:
+        raise Http404
+
+    next_url = None
+    if page.has_next:
+        query = request.GET.copy()
+        query['after'] = page.next_cursor
+        next_url = request.build_absolute_uri(
+            '{}?{}'.format(request.path, query.urlencode())
+        )
+    image_fields = _requested_fields(request, 'image', IMAGE_FIELDS)
+    return JsonResponse({
+        'album': serialize_album(
+            request, album, _requested_fields(request, 'album', ALBUM_FIELDS)
+        ),
+        'images': [serialize_image(request, image, image_fields)
+                   for image in page],
+        'next': next_url,
+    })
+
+
+@api_view(_image_scopes)
+def image_detail(request, pk):
+    image = Image.objects.filter(pk=pk).values(*IMAGE_COLUMNS).first()
+    if image is None:
+        raise Http404
+    return JsonResponse({
+        'image': serialize_image(
+            request, image, _requested_fields(request, 'image', IMAGE_FIELDS)
+        )
+    })
@@ -0,0 +1,162 @@
+"""
+Full page caching of the public gallery pages.
+
+Cached pages are keyed by the version of everything they show, rather than
+being deleted when something changes: the menu page by the MENU version and
+each album page by its category's version.  Image and Category changes bump
+the versions (see invalidate_pages and its callers), so the next request
+for an affected page misses the cache and re-renders, and stale pages
+simply age out of the cache.
+
+Only anonymous GET requests are served from the cache, so logged in (and
+in particular staff) users always get a freshly rendered page.
+"""
+import hashlib
+import time
+
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.db import connection, transaction
+
+
+MENU = 'menu'
+
+
+def get_cache():
+    return caches[settings.GALLERY_CACHE_ALIAS]
+
+
+def category_scope(category_id):
+    return 'category:{}'.format(category_id)
+
+
+def _version_key(scope):
+    return 'gallery:version:{}'.format(scope)
+
+
+def _slug_key(slug):
+    return 'gallery:slug:{}'.format(slug)
+
+
+def _new_version():
+    # start from the time rather than 1, so a version that has been evicted
+    # from the cache can't restart at a number that older pages were
+    # cached under
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    cache = get_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _bump_versions(scopes):
+    cache = get_cache()
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:  # not in the cache
+            cache.set(_version_key(scope), _new_version(), None)
+
+
+def invalidate(scopes):
+    """
+    Bump the versions of `scopes`.
+
+    The versions are bumped straight away, so a user sees their own changes
+    on the next request, and again once the transaction commits, so that
+    anything built by another request before the commit (from the old data)
+    isn't used afterwards.
+    """
+    _bump_versions(scopes)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump_versions(scopes))
+
+
+def invalidate_pages(category_ids=()):
+    """
+    Invalidate the menu page and the pages of the given categories
+    """
+    invalidate([MENU] + [category_scope(id) for id in category_ids])
+
+
+def forget_category_slug(slug):
+    get_cache().delete(_slug_key(slug))
+
+
+def category_scopes(request, slug):
+    """
+    Cache scopes for an album page.  The slug's category id is cached too,
+    so a cached page can be served without touching the database.  Returns
+    None for an unknown slug, so 404s aren't cached.
+    """
+    from gallery.models import Category
+    cache = get_cache()
+    category_id = cache.get(_slug_key(slug))
+    if category_id is None:
+        category_id = Category.objects.filter(slug=slug) \
+            .values_list('id', flat=True).first()
+        if category_id is None:
+            return None
+        cache.set(_slug_key(slug), category_id, None)
+    return [category_scope(category_id)]
+
+
+def menu_scopes(request):
+    return [MENU]
+
+
+def _is_cacheable(request):
+    return (
+        settings.GALLERY_CACHE_PAGES and
+        request.method in ('GET', 'HEAD') and
+        not request.user.is_authenticated() and
+        not len(messages.get_messages(request))
+    )
+
+
+def cache_page_by_version(get_scopes):
+    """
+    Cache a view's pages for anonymous users, keyed by the request path and
+    the current versions of the scopes returned by
+    `get_scopes(request, *args, **kwargs)`.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not _is_cacheable(request):
+                return view(request, *args, **kwargs)
+            scopes = get_scopes(request, *args, **kwargs)
+            if scopes is None:
+                return view(request, *args, **kwargs)
+
+            cache = get_cache()
+            key = 'gallery:page:{}:{}'.format(
+                hashlib.md5(request.get_full_path().encode()).hexdigest(),
+                '.'.join(str(version) for version in get_versions(scopes))
+            )
+            response = cache.get(key)
+            if response is not None:
+                return response
+
+            response = view(request, *args, **kwargs)
+            # never cache cookies, which could be user specific
+            if response.status_code == 200 and not response.cookies:
+                if hasattr(response, 'render'):
+                    def cache_response(rendered):
+                        cache.set(key, rendered)
+                    response.add_post_render_callback(cache_response)
+                else:
+                    cache.set(key, response)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,57 @@
+import os
+
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+
+from PIL import Image as PILImage
+
+
+TILE_SIZE = 150
+PLACEHOLDER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'static', 'gallery', 'images', 'logo.png'
+)
+
+
+def _tile(file):
+    """
+    Open an image file and crop it to a centred TILE_SIZE square
+    """
+    image = PILImage.open(file)
+    image.draft('RGB', (TILE_SIZE, TILE_SIZE))
+    if image.mode != 'RGB':
+        # flatten any transparency (e.g. the png logo) onto white
+        image = image.convert('RGBA')
+        background = PILImage.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.split()[3])
+        image = background
+    width, height = image.size
+    side = min(width, height)
+    left = (width - side) // 2
+    top = (height - side) // 2
+    image = image.crop((left, top, left + side, top + side))
+    return image.resize((TILE_SIZE, TILE_SIZE), PILImage.ANTIALIAS)
+
+
+def make_collage(files):
+    """
+    Composite up to four image files into a single 2x2 JPEG, in the same
+    layout as the album covers on the gallery menu (top left, top right,
+    bottom left, bottom right).  Missing tiles are filled with the logo
+    placeholder.  Returns a ContentFile ready to be saved to an ImageField.
+    """
+    collage = PILImage.new('RGB', (TILE_SIZE * 2, TILE_SIZE * 2), 'white')
+    files = list(files)[:4]
+    files += [PLACEHOLDER] * (4 - len(files))
+    for index, file in enumerate(files):
+        try:
+            tile = _tile(file)
+        except IOError:  # missing or unreadable photo
+            tile = _tile(PLACEHOLDER)
+        position = ((index % 2) * TILE_SIZE, (index // 2) * TILE_SIZE)
+        collage.paste(tile, position)
+
+    output = BytesIO()
+    collage.save(output, format='JPEG', quality=70)
+    return ContentFile(output.getvalue())
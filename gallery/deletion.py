@@ -0,0 +1,236 @@
+"""
+Deletion of gallery media files.
+
+Files are never deleted while the transaction that deleted (or replaced)
+their model instances is still open.  They are collected into a batch for
+the current transaction and deleted together once it commits; deleting an
+album with 1,000 images queues 1,000 photos and their renditions and
+removes them after the single commit, optionally in a background thread
+(settings.GALLERY_DELETE_IN_BACKGROUND).
+
+Just before the batch is deleted, the files are checked against the
+database, CHUNK_SIZE keys per query, and any that are still referenced are
+kept.  That covers photos shared by several images (see gallery.storage)
+and deletes whose transaction or savepoint was rolled back.  Files that
+can't be deleted are recorded as FileDeletionFailures for the
+retry_gallery_file_deletions command.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from gallery.imagegenerators import RENDITIONS, VARIANT_FORMATS
+
+
+logger = logging.getLogger(__name__)
+
+PHOTO = 'photo'
+RENDITION = 'rendition'
+RAW_PHOTO = 'raw_photo'
+COLLAGE = 'collage'
+
+# (model name, field) that refers to each kind of file's key; renditions
+# are keyed by their photo, so photos and renditions are checked together
+REFERENCES = {
+    PHOTO: ('Image', 'photo'),
+    RENDITION: ('Image', 'photo'),
+    RAW_PHOTO: ('Image', 'raw_photo'),
+    COLLAGE: ('Category', 'collage'),
+}
+
+# keys looked up per query, well within SQLite's limit of 999 parameters
+CHUNK_SIZE = 500
+
+# Postgres advisory lock on the stored photo files (see lock_photo_files)
+PHOTO_FILES_LOCK = 4728401
+
+
+def lock_photo_files(exclusive=False):
+    """
+    Hold the lock on the stored photo files until the current transaction
+    ends.  Saving an image that reuses a stored photo file (see
+    gallery.storage) takes it shared, and deleting unreferenced files takes
+    it exclusively, so a deletion can't check for references to a file
+    while an image that reuses it is still uncommitted.  Only taken on
+    Postgres; SQLite, for development, has no equivalent.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock{}(%s)'.format(
+                '' if exclusive else '_shared'
+            ),
+            [PHOTO_FILES_LOCK]
+        )
+
+
+def _referenced(kind, keys):
+    """
+    The subset of `keys` that are still referenced in the database
+    """
+    from gallery import models
+    model_name, field = REFERENCES[kind]
+    model = getattr(models, model_name)
+    keys = sorted(keys)
+    referenced = set()
+    for start in range(0, len(keys), CHUNK_SIZE):
+        referenced.update(
+            model.objects.filter(
+                **{field + '__in': keys[start:start + CHUNK_SIZE]}
+            ).values_list(field, flat=True)
+        )
+    return referenced
+
+
+def get_storage(kind):
+    from gallery.models import Image
+    if kind == PHOTO:
+        return Image._meta.get_field('photo').storage
+    return default_storage
+
+
+def delete_unreferenced(files):
+    """
+    Delete those of the (kind, name, key) `files` whose keys are no longer
+    referenced in the database.  The check and the deletion happen in one
+    transaction, holding the photo files lock.
+    """
+    keys = {}
+    for kind, _, key in files:
+        keys.setdefault(REFERENCES[kind], (kind, set()))[1].add(key)
+    with transaction.atomic():
+        lock_photo_files(exclusive=True)
+        referenced = {
+            reference: _referenced(kind, kind_keys)
+            for reference, (kind, kind_keys) in keys.items()
+        }
+        return delete_files(
+            (kind, name) for kind, name, key in sorted(files)
+            if key not in referenced[REFERENCES[kind]]
+        )
+
+
+class DeletionBatch(object):
+
+    def __init__(self):
+        # (kind, name, key): `key` is what must no longer be referenced in
+        # the database for `name` to be deleted
+        self.files = set()
+
+    def flush(self):
+        """
+        Delete the batch's unreferenced files.  Runs once the batch's
+        transaction commits; only the first call does anything.
+        """
+        if getattr(connection, 'gallery_deletion_batch', None) is self:
+            connection.gallery_deletion_batch = None
+        files, self.files = self.files, set()
+        if not files:
+            return
+        if settings.GALLERY_DELETE_IN_BACKGROUND:
+            threading.Thread(
+                target=_delete_files_in_background, args=(files,)
+            ).start()
+        else:
+            delete_unreferenced(files)
+
+
+def _add(files):
+    """
+    Add (kind, name, key) files to the batch for the current transaction,
+    or delete them straight away if we're not in one.
+
+    The batch is kept on the connection until it's flushed, and each call
+    registers the flush to run on commit: if a savepoint (or the whole
+    transaction) is rolled back, its callbacks are dropped, but a later
+    commit still flushes the batch, and the files whose deletion was rolled
+    back are kept as they're still referenced.
+    """
+    if not connection.in_atomic_block:
+        delete_unreferenced(files)
+        return
+
+    batch = getattr(connection, 'gallery_deletion_batch', None)
+    if batch is None:
+        batch = connection.gallery_deletion_batch = DeletionBatch()
+    batch.files.update(files)
+    transaction.on_commit(batch.flush)
+
+
+def schedule_deletion(kind, name, key=None):
+    if name:
+        _add([(kind, name, key or name)])
+
+
+def schedule_photo_deletion(photo_name):
+    """
+    Schedule a photo and its renditions for deletion once the photo is no
+    longer used by any image
+    """
+    from gallery.models import Image
+    if not photo_name:
+        return
+    # rendition names are derived from the photo name, so they can be found
+    # without any file access
+    image = Image(photo=photo_name)
+    formats = [None] + [format for format, _, _ in VARIANT_FORMATS]
+    _add(
+        [(PHOTO, photo_name, photo_name)] +
+        [(RENDITION, image.rendition_file(rendition, format).name, photo_name)
+         for rendition, _ in RENDITIONS for format in formats]
+    )
+
+
+def _delete_files_in_background(files):
+    try:
+        delete_unreferenced(files)
+    finally:
+        connection.close()
+
+
+def delete_files(files):
+    """
+    Delete (kind, name) files, recording any that fail
+    """
+    from gallery.models import FileDeletionFailure
+    failures = []
+    for kind, name in files:
+        try:
+            get_storage(kind).delete(name)
+        except Exception as e:
+            logger.error('Could not delete %s file %s: %s', kind, name, e)
+            failures.append(
+                FileDeletionFailure(kind=kind, name=name, error=str(e))
+            )
+    if failures:
+        FileDeletionFailure.objects.bulk_create(failures)
+    return failures
+
+
+def retry_failed_deletions():
+    """
+    Retry deleting the files recorded as FileDeletionFailures.  Returns the
+    number of files still failing.
+    """
+    from gallery.models import FileDeletionFailure
+    still_failing = 0
+    with transaction.atomic():
+        lock_photo_files(exclusive=True)
+        for failure in FileDeletionFailure.objects.all():
+            if failure.name in _referenced(failure.kind, [failure.name]):
+                failure.delete()  # in use again, so not to be deleted
+                continue
+            try:
+                get_storage(failure.kind).delete(failure.name)
+            except Exception as e:
+                failure.attempts += 1
+                failure.error = str(e)
+                failure.save()
+                still_failing += 1
+            else:
+                failure.delete()
+    return still_failing
@@ -0,0 +1,177 @@
+"""
+Near-duplicate detection, from the perceptual hashes of the photos (see
+gallery.analysis.difference_hash).
+
+Two photos are near-duplicates if their hashes differ in at most
+settings.GALLERY_DUPLICATE_DISTANCE bits.  The hashes are held in a BK-tree,
+which only visits the branches that could be within that distance, so a
+lookup doesn't compare against every image.  Each process keeps one tree.
+Images hashed since it was last brought up to date, which are those with
+higher ids than any in it, are added to it (from a single query) on each
+lookup; it's only rebuilt when the cached INDEX version shows that images
+have been deleted or rehashed (see invalidate_index).
+"""
+from django.conf import settings
+
+from gallery.cache import get_versions, invalidate
+
+
+INDEX = 'duplicates'
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree(object):
+    """
+    A BK-tree of integer hashes under the hamming distance.  Each node
+    holds the items with one hash value, and its children by their distance
+    from it; by the triangle inequality, a search for values within
+    `max_distance` of a target that is `d` from a node only needs to visit
+    the children `d - max_distance` to `d + max_distance` from it.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            node_value, items, children = node
+            distance = hamming_distance(value, node_value)
+            if distance == 0:
+                items.append(item)
+                return
+            if distance not in children:
+                children[distance] = (value, [item], {})
+                return
+            node = children[distance]
+
+    def search(self, value, max_distance):
+        """
+        (distance, item) for each item within `max_distance` of `value`
+        """
+        found = []
+        candidates = [self.root] if self.root else []
+        while candidates:
+            node_value, items, children = candidates.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item) for item in items)
+            candidates.extend(
+                child for child_distance, child in children.items()
+                if abs(child_distance - distance) <= max_distance
+            )
+        return found
+
+
+_index = None
+_index_version = None
+_index_last_id = 0
+
+
+def invalidate_index():
+    """
+    Have each process rebuild its index on its next lookup.  Needed when
+    images are deleted, or hashed after images with higher ids (which the
+    indexes may already include); newly hashed images are otherwise added
+    to the indexes as they are.
+    """
+    invalidate([INDEX])
+
+
+def get_index():
+    """
+    A BKTree of the ids of every image with a perceptual hash
+    """
+    from gallery.models import Image
+    global _index, _index_version, _index_last_id
+    version = get_versions([INDEX])[0]
+    if _index is None or version != _index_version:
+        _index, _index_version, _index_last_id = BKTree(), version, 0
+    for image_id, phash in Image.objects.exclude(phash='') \
+            .filter(id__gt=_index_last_id).order_by('id') \
+            .values_list('id', 'phash').iterator():
+        _index.add(int(phash, 16), image_id)
+        _index_last_id = image_id
+    return _index
+
+
+def similar_image_ids(phash, max_distance=None, exclude=(), index=None):
+    """
+    (distance, image id) of the images whose photos look like the one with
+    perceptual hash `phash`, closest first.  Pass the `index` to look up
+    several hashes without bringing it up to date for each.
+    """
+    if not phash:
+        return []
+    if max_distance is None:
+        max_distance = settings.GALLERY_DUPLICATE_DISTANCE
+    if index is None:
+        index = get_index()
+    return sorted(
+        (distance, image_id) for distance, image_id
+        in index.search(int(phash, 16), max_distance)
+        if image_id not in exclude
+    )
+
+
+def find_duplicates_of(images, max_distance=None):
+    """
+    A dict of each of `images` that has near-duplicates to a list of them
+    (Images, with their categories), e.g. to warn about newly uploaded ones
+    """
+    from gallery.models import Image
+    images = list(images)
+    index = get_index() if any(image.phash for image in images) else None
+    similar = {
+        image: [
+            image_id for _, image_id
+            in similar_image_ids(image.phash, max_distance, [image.id], index)
+        ]
+        for image in images
+    }
+    found = Image.objects.select_related('category').in_bulk(
+        {image_id for image_ids in similar.values() for image_id in image_ids}
+    )
+    return {
+        image: [found[image_id] for image_id in image_ids if image_id in found]
+        for image, image_ids in similar.items() if image_ids
+    }
+
+
+def find_duplicate_groups(max_distance=None):
+    """
+    Groups (sets of image ids) of near-duplicate images, across the whole
+    library.  Groups are joined transitively, so a group can contain two
+    images further apart than `max_distance` if others link them.
+    """
+    index = get_index()
+    if max_distance is None:
+        max_distance = settings.GALLERY_DUPLICATE_DISTANCE
+
+    # union-find of image ids, each pointing towards its group's root
+    parents = {}
+
+    def root(image_id):
+        while parents.get(image_id, image_id) != image_id:
+            image_id = parents[image_id]
+        return image_id
+
+    stack = [index.root] if index.root else []
+    while stack:
+        node_value, items, children = stack.pop()
+        stack.extend(children.values())
+        for _, image_id in index.search(node_value, max_distance):
+            parents[root(image_id)] = root(items[0])
+
+    groups = {}
+    for image_id in parents:
+        groups.setdefault(root(image_id), set()).add(image_id)
+    return [group for group in groups.values() if len(group) > 1]
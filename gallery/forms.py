@@ -1,4 +1,8 @@
+import zipfile
+
 from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.forms.models import modelformset_factory, BaseModelFormSet, \
     inlineformset_factory, formset_factory, BaseFormSet, BaseInlineFormSet
 
@@ -11,7 +15,49 @@ class ImageThumbnailFileInput(ClearableFileInput):
     template_name = 'gallery/image_thumbnail.html'
 
 
-class CategoriesBaseFormSet(BaseModelFormSet):
+class ExistingInstanceField(forms.ModelChoiceField):
+    """
+    The primary key field of a model formset's forms.  Looks instances up
+    among the formset's existing objects, which the formset fetches in a
+    single query, rather than with a query per form.
+    """
+
+    def __init__(self, formset, *args, **kwargs):
+        self.formset = formset
+        super(ExistingInstanceField, self).__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            pk = self.formset.model._meta.pk.to_python(value)
+        except ValidationError:
+            pk = None
+        instance = self.formset._existing_object(pk)
+        if instance is None:
+            raise ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice'
+            )
+        return instance
+
+
+class ExistingInstancesMixin(object):
+    """
+    Model formset mixin that validates the forms' primary keys against the
+    formset's queryset (see ExistingInstanceField)
+    """
+
+    def add_fields(self, form, index):
+        super(ExistingInstancesMixin, self).add_fields(form, index)
+        field = form.fields.get(self._pk_field.name)
+        if isinstance(field, forms.ModelChoiceField):
+            form.fields[self._pk_field.name] = ExistingInstanceField(
+                self, field.queryset, initial=field.initial, required=False,
+                widget=field.widget
+            )
+
+
+class CategoriesBaseFormSet(ExistingInstancesMixin, BaseModelFormSet):
 
     def add_fields(self, form, index):
         super(CategoriesBaseFormSet, self).add_fields(form, index)
@@ -30,7 +76,7 @@ class CategoriesBaseFormSet(BaseModelFormSet):
         )
         form.DELETE_id = 'DELETE_{}'.format(index)
 
-        form.image_count = form.instance.images.count()
+        form.image_count = form.instance.image_count
 
         form.fields['name'] = forms.CharField(
             widget=forms.TextInput(
@@ -54,7 +100,21 @@ CategoriesFormset = modelformset_factory(
     can_delete=True
 )
 
-class ImageBaseFormset(BaseInlineFormSet):
+class ImageForm(forms.ModelForm):
+
+    def save(self, commit=True):
+        upload = self.cleaned_data.get('photo')
+        if settings.GALLERY_DEFER_PROCESSING and upload and \
+                'photo' in self.changed_data:
+            # Store the upload as it is and leave any existing photo in place
+            # until the process_gallery_images worker has processed it
+            self.instance.raw_photo = upload
+            self.instance.photo = self.initial.get('photo')
+            self.instance.status = Image.PENDING
+        return super(ImageForm, self).save(commit)
+
+
+class ImageBaseFormset(ExistingInstancesMixin, BaseInlineFormSet):
 
     def add_fields(self, form, index):
         super(ImageBaseFormset, self).add_fields(form, index)
@@ -86,6 +146,7 @@ class ImageBaseFormset(BaseInlineFormSet):
 ImageFormset = inlineformset_factory(
     Category,
     Image,
+    form=ImageForm,
     formset=ImageBaseFormset,
     fields=('photo', 'caption'),
     can_delete=True,
@@ -99,3 +160,17 @@ class CategoryForm(forms.ModelForm):
         model = Category
         fields = ('name', 'description')
 
+
+class ImportImagesForm(forms.Form):
+
+    archive = forms.FileField(
+        label='Zip file of images',
+        widget=forms.ClearableFileInput(attrs={'class': 'filestyle'}),
+    )
+
+    def clean_archive(self):
+        archive = self.cleaned_data['archive']
+        if not zipfile.is_zipfile(archive):
+            raise forms.ValidationError('Zip files only')
+        archive.seek(0)
+        return archive
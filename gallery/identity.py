@@ -0,0 +1,61 @@
+"""
+A per-request identity map of gallery model instances.
+
+Views register the instances they fetch, and look instances up through the
+map, so each row is loaded at most once per request and every reference to
+it shares one object.  Registered instances also have their foreign keys
+to other registered instances filled in, so e.g. an album's images don't
+each load the album again.
+"""
+from django.core.exceptions import ValidationError
+
+
+class IdentityMap(object):
+
+    def __init__(self):
+        self._instances = {}
+
+    def _key(self, model, pk):
+        model = model._meta.concrete_model
+        return model, model._meta.pk.to_python(pk)
+
+    def add(self, instance):
+        """
+        Register a fetched instance.  Returns the registered instance with
+        its primary key, which is `instance` unless one was already
+        registered.
+        """
+        instance = self._instances.setdefault(
+            self._key(type(instance), instance.pk), instance
+        )
+        for field in instance._meta.concrete_fields:
+            if field.many_to_one:
+                related = self._instances.get(self._key(
+                    field.related_model, getattr(instance, field.attname)
+                ))
+                if related is not None:
+                    setattr(instance, field.get_cache_name(), related)
+        return instance
+
+    def add_all(self, instances):
+        return [self.add(instance) for instance in instances]
+
+    def get(self, model, pk):
+        """
+        The instance of `model` with primary key `pk`, only fetched if it
+        isn't registered already.  Raises model.DoesNotExist if there's no
+        such instance.
+        """
+        try:
+            key = self._key(model, pk)
+        except ValidationError:
+            raise model.DoesNotExist
+        if key not in self._instances:
+            self.add(model._default_manager.get(pk=key[1]))
+        return self._instances[key]
+
+
+def get_identity_map(request):
+    if not hasattr(request, '_gallery_identity_map'):
+        request._gallery_identity_map = IdentityMap()
+    return request._gallery_identity_map
@@ -0,0 +1,97 @@
+from django.core.files.storage import default_storage
+
+from imagekit import ImageSpec
+from imagekit.processors import ResizeToFit
+
+from PIL import Image as PILImage
+
+
+class Pregenerated(object):
+    """
+    Cache file strategy for the renditions, which are generated when their
+    photo is stored (see Image.generate_renditions) rather than when a page
+    asks for their urls.  Whether a rendition exists is looked up in
+    imagekit's cache of file states, so a page render never encodes images.
+    """
+
+    def should_verify_existence(self, file):
+        return True
+
+
+class Rendition(ImageSpec):
+    """
+    Base spec for the gallery renditions.  Renditions keep the aspect ratio
+    of the source photo and are never upscaled, so small photos are only
+    re-encoded.
+    """
+    width = None
+    height = None
+    format = 'JPEG'
+    options = {'quality': 70}
+    cachefile_strategy = 'gallery.imagegenerators.Pregenerated'
+    # the storage gallery.deletion removes renditions from; imagekit's own
+    # default is a separate instance that keeps the MEDIA_ROOT it was made
+    # with
+    cachefile_storage = default_storage
+
+    @property
+    def processors(self):
+        return [ResizeToFit(self.width, self.height, upscale=False)]
+
+
+class Thumbnail(Rendition):
+    # album grid and menu covers; thumbnail containers are 150px square,
+    # so this leaves enough for high density screens
+    width = 320
+    height = 320
+    options = {'quality': 60}
+
+
+class Medium(Rendition):
+    width = 800
+    height = 800
+
+
+class Large(Rendition):
+    # used by the modal viewer
+    width = 1600
+    height = 1600
+
+
+# rendition name (the Image attribute) and the spec that generates it, from
+# smallest to largest.  The ImageSpecFields on gallery.Image register these
+# with imagekit as 'gallery:image:<name>'.
+RENDITIONS = (
+    ('thumbnail', Thumbnail),
+    ('medium', Medium),
+    ('large', Large),
+)
+
+
+def _can_save(format):
+    PILImage.init()
+    return format in PILImage.SAVE
+
+
+# formats that compress better than JPEG, which the renditions are also
+# generated in if this Pillow build can encode them, best first: (PIL
+# format, mime type, options).  Pages offer them to browsers with <picture>
+# <source>s, with the JPEG rendition as the fallback.
+VARIANT_FORMATS = tuple(
+    (format, mime_type, options)
+    for format, mime_type, options in (
+        ('AVIF', 'image/avif', {'quality': 50}),
+        ('WEBP', 'image/webp', {'quality': 65}),
+    )
+    if _can_save(format)
+)
+
+# (rendition name, PIL format): spec
+VARIANT_SPECS = {
+    (name, format): type(
+        spec.__name__ + format.title(), (spec,),
+        {'format': format, 'options': options}
+    )
+    for name, spec in RENDITIONS
+    for format, _, options in VARIANT_FORMATS
+}
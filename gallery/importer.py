@@ -0,0 +1,245 @@
+"""
+Bulk import of photos into a gallery album, from a zip archive or a
+directory.  Archive members are read one at a time (never extracting the
+whole archive), encoded across a multiprocessing pool (or in this process,
+in a web request) and inserted with a single bulk_create per batch.  The
+batch's renditions are then generated the same way, so pages never have to.
+"""
+import logging
+import multiprocessing
+import os
+import time
+import zipfile
+
+from io import BytesIO
+
+from django.core.files.base import ContentFile, File
+from django.db import transaction
+
+from imagekit.utils import generate
+
+from gallery.analysis import analyse
+from gallery.cache import invalidate_pages
+from gallery.models import Category, Image
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp'
+)
+
+
+class ImportStats(object):
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = []
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.started = time.time()
+        self.finished = None
+
+    @property
+    def seconds(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def images_per_second(self):
+        return self.imported / self.seconds if self.seconds else 0
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_in - self.bytes_out
+
+    def __str__(self):
+        return '{} image(s) imported, {} failed in {:.1f}s ' \
+               '({:.1f} images/s); {:.1f} MB read, {:.1f} MB saved'.format(
+                    self.imported, len(self.failed), self.seconds,
+                    self.images_per_second, self.bytes_in / 1e6,
+                    self.bytes_saved / 1e6
+                )
+
+
+def _is_image_name(name):
+    basename = os.path.basename(name)
+    return not basename.startswith('.') and \
+        os.path.splitext(basename)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_zip(file):
+    """
+    Yield (filename, bytes) for each image in a zip archive (a path or a
+    file object), reading one member at a time
+    """
+    with zipfile.ZipFile(file) as archive:
+        for info in archive.infolist():
+            if info.filename.startswith('__MACOSX/') or \
+                    not _is_image_name(info.filename):
+                continue
+            with archive.open(info) as member:
+                yield os.path.basename(info.filename), member.read()
+
+
+def iter_directory(path):
+    """
+    Yield (filename, bytes) for each image in a directory and its
+    subdirectories
+    """
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if _is_image_name(filename):
+                with open(os.path.join(dirpath, filename), 'rb') as file:
+                    yield filename, file.read()
+
+
+def iter_source(source):
+    if isinstance(source, str) and os.path.isdir(source):
+        return iter_directory(source)
+    return iter_zip(source)
+
+
+def encode_photo(entry):
+    """
+    Encode an uploaded photo exactly as Image.photo's ProcessedImageField
+    would, and analyse it (see gallery.analysis).  Runs in the pool's worker
+    processes.  Returns (filename, original size, encoded bytes or None,
+    analysis field values, error or None).
+    """
+    filename, data = entry
+    try:
+        spec = Image._meta.get_field('photo').get_spec(
+            source=File(BytesIO(data), name=filename)
+        )
+        encoded = generate(spec).read()
+        values = analyse(BytesIO(encoded), len(encoded))
+    except Exception as e:  # a bad photo mustn't abort the import
+        return filename, len(data), None, {}, str(e) or repr(e)
+    return filename, len(data), encoded, values, None
+
+
+def generate_photo_renditions(name):
+    """
+    Generate the renditions of a stored photo.  Runs in the pool's worker
+    processes.  Returns (photo name, error or None).
+    """
+    try:
+        Image(photo=name).generate_renditions()
+    except Exception as e:  # pages fall back to the photo
+        return name, str(e) or repr(e)
+    return name, None
+
+
+def _batches(entries, size):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _save_batch(category, photos, stats):
+    """
+    Store the batch's encoded photos and create their images.  Returns the
+    names of the stored photos.
+    """
+    field = Image._meta.get_field('photo')
+    images = []
+    # the photos are stored in the transaction that creates their images,
+    # so a pending deletion of a reused photo file waits for it (see
+    # gallery.storage)
+    with transaction.atomic():
+        for filename, data, values in photos:
+            name = os.path.splitext(filename)[0] + '.jpg'
+            image = Image(category=category, **values)
+            # the content is already encoded; save it straight to storage
+            # rather than through the field, which would encode it again
+            image.photo.name = field.storage.save(
+                field.generate_filename(image, name), ContentFile(data)
+            )
+            images.append(image)
+
+        Image.objects.bulk_create(images)
+        Category.objects.filter(id=category.id).images_changed(len(images))
+        invalidate_pages([category.id])
+    stats.imported += len(images)
+    return sorted({image.photo.name for image in images})
+
+
+def _import_batches(category, source, batch_size, imap, stats):
+    for batch in _batches(iter_source(source), batch_size):
+        photos = []
+        for filename, size, encoded, values, error in imap(
+                encode_photo, batch
+        ):
+            stats.bytes_in += size
+            if error:
+                logger.warning('Could not import %s: %s', filename, error)
+                stats.failed.append(filename)
+                continue
+            stats.bytes_out += len(encoded)
+            photos.append((filename, encoded, values))
+        names = _save_batch(category, photos, stats)
+        for name, error in imap(generate_photo_renditions, names):
+            if error:
+                logger.warning(
+                    'Could not generate renditions of %s: %s', name, error
+                )
+
+
+def import_images(category, source, processes=None, batch_size=None):
+    """
+    Import every image in `source` (a zip file path or file object, or a
+    directory path) into `category`, encoding across `processes` worker
+    processes (defaults to the number of cpus).  With one process, images
+    are encoded in this process without starting a pool, as web requests
+    should.  Returns an ImportStats.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    batch_size = batch_size or processes * 4
+    stats = ImportStats()
+
+    if processes == 1:
+        _import_batches(category, source, batch_size, map, stats)
+    else:
+        # the pool's workers only touch files, all db access is in this
+        # process
+        with multiprocessing.Pool(processes) as pool:
+            _import_batches(category, source, batch_size, pool.imap, stats)
+
+    stats.finished = time.time()
+    logger.info('Import to gallery category %s: %s', category, stats)
+    return stats
+
+
+def queue_images(category, source):
+    """
+    Store every image in `source` unprocessed, as pending images for the
+    process_gallery_images worker (see gallery.processing).  Returns an
+    ImportStats.
+    """
+    field = Image._meta.get_field('raw_photo')
+    stats = ImportStats()
+    for batch in _batches(iter_source(source), 50):
+        images = []
+        for filename, data in batch:
+            image = Image(category=category, status=Image.PENDING)
+            image.raw_photo.name = field.storage.save(
+                field.generate_filename(image, filename), ContentFile(data)
+            )
+            stats.bytes_in += len(data)
+            images.append(image)
+        with transaction.atomic():
+            Image.objects.bulk_create(images)
+            Category.objects.filter(id=category.id).images_changed(
+                len(images)
+            )
+            invalidate_pages([category.id])
+        stats.imported += len(images)
+    stats.bytes_out = stats.bytes_in
+    stats.finished = time.time()
+    return stats
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from gallery.analysis import ANALYSES, backfill
+
+
+class Command(BaseCommand):
+    help = "Compute the data derived from gallery photos (dimensions, " \
+           "placeholders etc.) for existing images that don't have it yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only', action='append', choices=list(ANALYSES),
+            help='Only run this analysis (may be given more than once)'
+        )
+        parser.add_argument(
+            '--all', action='store_true', dest='redo',
+            help='Recompute for every image, not just those missing data'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Number of processes to analyse images with (defaults to '
+                 'the number of cpus)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of images to save per transaction'
+        )
+
+    def handle(self, *args, **options):
+        updated, failed = backfill(
+            only=options['only'], redo=options['redo'],
+            processes=options['processes'], batch_size=options['batch_size']
+        )
+        self.stdout.write(
+            '{} image(s) updated, {} failed'.format(updated, failed)
+        )
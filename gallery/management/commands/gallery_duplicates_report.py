@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gallery.duplicates import find_duplicate_groups
+from gallery.models import Image
+
+
+class Command(BaseCommand):
+    help = 'List groups of near-duplicate photos in the gallery, by their ' \
+           'perceptual hashes (run backfill_gallery_images --only phash ' \
+           'first for images uploaded before hashing)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--distance', type=int,
+            default=settings.GALLERY_DUPLICATE_DISTANCE,
+            help='Maximum number of differing hash bits (default %(default)s)'
+        )
+
+    def handle(self, *args, **options):
+        groups = find_duplicate_groups(options['distance'])
+        images = Image.objects.select_related('category').in_bulk(
+            {image_id for group in groups for image_id in group}
+        )
+        for number, group in enumerate(
+                sorted(groups, key=min), start=1
+        ):
+            self.stdout.write('Group {}:'.format(number))
+            for image_id in sorted(group):
+                image = images[image_id]
+                self.stdout.write(
+                    '  image {} in "{}": {}'.format(
+                        image.id, image.category.name, image.filename
+                    )
+                )
+        self.stdout.write(
+            '{} group(s) of near-duplicates, {} image(s); {} image(s) not '
+            'yet hashed'.format(
+                len(groups), len(images),
+                Image.objects.filter(phash='').exclude(photo='')
+                .exclude(photo__isnull=True).count()
+            )
+        )
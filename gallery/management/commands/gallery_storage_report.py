@@ -0,0 +1,78 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from gallery.deletion import schedule_photo_deletion
+from gallery.models import Image
+from gallery.storage import is_content_addressed
+
+
+def _megabytes(size):
+    return '{:.1f} MB'.format(size / 1e6)
+
+
+class Command(BaseCommand):
+    help = 'Report the disk space saved by storing identical gallery ' \
+           'photos once'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--migrate', action='store_true',
+            help='First move photos uploaded before content addressed '
+                 'storage into it, merging any duplicates'
+        )
+
+    def handle(self, *args, **options):
+        storage = Image._meta.get_field('photo').storage
+        if options['migrate']:
+            self.migrate(storage)
+
+        references = Counter(
+            Image.objects.exclude(photo='').exclude(photo__isnull=True)
+            .values_list('photo', flat=True)
+        )
+        stored = 0
+        referenced = 0
+        missing = 0
+        for name, count in references.items():
+            try:
+                size = storage.size(name)
+            except OSError:
+                missing += 1
+                continue
+            stored += size
+            referenced += size * count
+
+        self.stdout.write(
+            '{} images, {} photo files ({} missing)'.format(
+                sum(references.values()), len(references), missing
+            )
+        )
+        self.stdout.write('Disk used: {}'.format(_megabytes(stored)))
+        self.stdout.write(
+            'Disk saved by deduplication: {}'.format(
+                _megabytes(referenced - stored)
+            )
+        )
+
+    def migrate(self, storage):
+        names = set(
+            Image.objects.exclude(photo='').exclude(photo__isnull=True)
+            .values_list('photo', flat=True)
+        )
+        migrated = 0
+        for name in names:
+            if is_content_addressed(name) or not storage.exists(name):
+                continue
+            with storage.open(name) as file:
+                new_name = storage.save(name, file)
+            with transaction.atomic():
+                Image.objects.filter(photo=name).update(photo=new_name)
+                schedule_photo_deletion(name)
+            migrated += 1
+        self.stdout.write(
+            '{} photo file(s) moved to content addressed storage'.format(
+                migrated
+            )
+        )
@@ -0,0 +1,53 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.importer import import_images
+from gallery.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Import all the images in a zip file or directory into a ' \
+           'gallery album'
+
+    def add_arguments(self, parser):
+        parser.add_argument('category', help='Album name, slug or id')
+        parser.add_argument('source', help='Path to a zip file or directory')
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Number of processes to encode images with (defaults to '
+                 'the number of cpus)'
+        )
+        parser.add_argument(
+            '--create', action='store_true',
+            help="Create the album if it doesn't exist"
+        )
+
+    def _get_category(self, value, create):
+        categories = Category.objects.filter(slug=value) | \
+            Category.objects.filter(name=value)
+        if value.isdigit():
+            categories |= Category.objects.filter(id=int(value))
+        categories = list(categories)
+        if len(categories) == 1:
+            return categories[0]
+        if len(categories) > 1:
+            raise CommandError(
+                'More than one album matches {}; use the album id'.format(
+                    value
+                )
+            )
+        if create:
+            return Category.objects.create(name=value)
+        raise CommandError('Album {} does not exist'.format(value))
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['source']):
+            raise CommandError('{} does not exist'.format(options['source']))
+        category = self._get_category(options['category'], options['create'])
+        stats = import_images(
+            category, options['source'], processes=options['processes']
+        )
+        for filename in stats.failed:
+            self.stderr.write('Could not import {}'.format(filename))
+        self.stdout.write(str(stats))
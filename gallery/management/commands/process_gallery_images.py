@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from gallery.models import Image
+from gallery.processing import process_pending_images
+
+
+class Command(BaseCommand):
+    help = 'Process gallery uploads that are waiting to be processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep polling for new uploads instead of exiting when '
+                 'there are none left'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2,
+            help='Seconds to wait between polls when looping (default 2)'
+        )
+        parser.add_argument(
+            '--requeue', action='store_true',
+            help='Reset failed images, and images left in processing by a '
+                 'worker that was stopped, to pending before starting'
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            requeued = Image.objects.filter(
+                status__in=[Image.PROCESSING, Image.FAILED],
+                raw_photo__isnull=False
+            ).update(status=Image.PENDING)
+            self.stdout.write('{} image(s) requeued'.format(requeued))
+
+        while True:
+            processed = process_pending_images()
+            if processed:
+                self.stdout.write('{} image(s) processed'.format(processed))
+            if not options['loop']:
+                break
+            # don't hold a connection open while idle
+            connection.close()
+            time.sleep(options['sleep'])
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, When
+
+from gallery.models import Category
+
+
+class Command(BaseCommand):
+    help = "Correct any albums whose stored image_count doesn't match the " \
+           "number of images they actually have"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drifted counts without changing them'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = {
+                category_id: actual
+                for category_id, stored, actual in Category.objects.annotate(
+                    actual=Count('images')
+                ).values_list('id', 'image_count', 'actual')
+                if stored != actual
+            }
+
+            for category in Category.objects.filter(id__in=drifted):
+                self.stdout.write(
+                    '{}: stored count {}, actual count {}'.format(
+                        category, category.image_count, drifted[category.id]
+                    )
+                )
+
+            if drifted and not options['dry_run']:
+                # one UPDATE for all drifted albums
+                Category.objects.filter(id__in=drifted).update(
+                    image_count=Case(
+                        *[When(id=category_id, then=actual)
+                          for category_id, actual in drifted.items()],
+                        output_field=IntegerField()
+                    )
+                )
+
+        self.stdout.write(
+            '{} album count(s) {}'.format(
+                len(drifted),
+                'to correct' if options['dry_run'] else 'corrected'
+            )
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from gallery.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Build (or rebuild) the cover collage for each gallery album'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild collages even if the cover images are unchanged'
+        )
+
+    def handle(self, *args, **options):
+        for category in Category.objects.all():
+            category.refresh_collage(force=options['force'])
+            self.stdout.write('Refreshed collage for {}'.format(category))
@@ -0,0 +1,153 @@
+import json
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.models import Category, Image
+from gallery.processing import regenerate_image_renditions
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the renditions of gallery images (e.g. after ' \
+           'changing the rendition sizes or quality) across a pool of ' \
+           'processes.  Progress is checkpointed, so a stopped run can be ' \
+           'resumed by running the command again with the same options.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--category', action='append', default=[],
+            help='Only images in this album (name, slug or id); may be '
+                 'given more than once'
+        )
+        parser.add_argument(
+            '--from-id', type=int, default=None,
+            help='Only images with this id or higher'
+        )
+        parser.add_argument(
+            '--to-id', type=int, default=None,
+            help='Only images with this id or lower'
+        )
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Only generate renditions that don\'t exist yet, e.g. for '
+                 'images stored before renditions were generated on upload'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Number of processes to generate renditions with (defaults '
+                 'to the number of cpus)'
+        )
+        parser.add_argument(
+            '--checkpoint', default='regenerate_gallery_renditions.json',
+            help='File to record progress in (default '
+                 'regenerate_gallery_renditions.json)'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore any checkpoint and start from the beginning'
+        )
+
+    def _get_category_ids(self, values):
+        category_ids = []
+        for value in values:
+            categories = Category.objects.filter(slug=value) | \
+                Category.objects.filter(name=value)
+            if value.isdigit():
+                categories |= Category.objects.filter(id=int(value))
+            ids = list(categories.values_list('id', flat=True))
+            if len(ids) != 1:
+                raise CommandError(
+                    'Album {} {}'.format(
+                        value, 'is ambiguous; use the album id' if ids
+                        else 'does not exist'
+                    )
+                )
+            category_ids.extend(ids)
+        return sorted(category_ids)
+
+    def _read_checkpoint(self, path, filters):
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            checkpoint = json.load(file)
+        if checkpoint['filters'] != filters:
+            self.stdout.write(
+                'Ignoring checkpoint {}, which was for different '
+                'options'.format(path)
+            )
+            return None
+        return checkpoint['last_id']
+
+    def _write_checkpoint(self, path, filters, last_id):
+        # write then rename, so a killed run never leaves a partial file
+        with open(path + '.tmp', 'w') as file:
+            json.dump({'filters': filters, 'last_id': last_id}, file)
+        os.replace(path + '.tmp', path)
+
+    def handle(self, *args, **options):
+        filters = {
+            'category_ids': self._get_category_ids(options['category']),
+            'from_id': options['from_id'],
+            'to_id': options['to_id'],
+        }
+        images = Image.objects.exclude(photo='').exclude(photo__isnull=True)
+        if filters['category_ids']:
+            images = images.filter(category_id__in=filters['category_ids'])
+        if filters['from_id'] is not None:
+            images = images.filter(id__gte=filters['from_id'])
+        if filters['to_id'] is not None:
+            images = images.filter(id__lte=filters['to_id'])
+
+        checkpoint = options['checkpoint']
+        last_id = None if options['restart'] \
+            else self._read_checkpoint(checkpoint, filters)
+        if last_id is not None:
+            self.stdout.write('Resuming after image {}'.format(last_id))
+            images = images.filter(id__gt=last_id)
+
+        force = not options['missing']
+        photos = [
+            (image_id, photo, force) for image_id, photo
+            in images.order_by('id').values_list('id', 'photo')
+        ]
+        processes = options['processes'] or multiprocessing.cpu_count()
+        started = time.time()
+        timings = []
+        failed = 0
+        # the pool's workers only touch files; results come back in id
+        # order, so the checkpoint is always the last image done
+        with multiprocessing.Pool(processes) as pool:
+            for image_id, seconds, error in pool.imap(
+                    regenerate_image_renditions, photos
+            ):
+                if error:
+                    failed += 1
+                    self.stderr.write(
+                        'Image {}: failed ({})'.format(image_id, error)
+                    )
+                else:
+                    timings.append((seconds, image_id))
+                    if options['verbosity'] > 1:
+                        self.stdout.write(
+                            'Image {}: {:.2f}s'.format(image_id, seconds)
+                        )
+                self._write_checkpoint(checkpoint, filters, image_id)
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)  # finished
+
+        elapsed = time.time() - started
+        summary = '{} image(s) regenerated, {} failed, in {:.1f}s'.format(
+            len(timings), failed, elapsed
+        )
+        if timings:
+            slowest, slowest_id = max(timings)
+            summary += ' ({:.2f} images/s; {:.2f}s per image, slowest ' \
+                'image {} at {:.2f}s)'.format(
+                    len(timings) / elapsed if elapsed else 0,
+                    sum(seconds for seconds, _ in timings) / len(timings),
+                    slowest_id, slowest
+                )
+        self.stdout.write(summary)
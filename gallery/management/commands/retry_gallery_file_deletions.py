@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from gallery.deletion import retry_failed_deletions
+from gallery.models import FileDeletionFailure
+
+
+class Command(BaseCommand):
+    help = "Retry deleting gallery media files that couldn't be deleted " \
+           "when their images or albums were deleted"
+
+    def handle(self, *args, **options):
+        total = FileDeletionFailure.objects.count()
+        still_failing = retry_failed_deletions()
+        self.stdout.write(
+            '{} file(s) resolved, {} still failing'.format(
+                total - still_failing, still_failing
+            )
+        )
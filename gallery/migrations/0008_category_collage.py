@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0007_auto_20160217_1031'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='collage',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='gallery/collages'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='collage_key',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_image_counts(apps, schema_editor):
+    Category = apps.get_model('gallery', 'Category')
+    for category in Category.objects.annotate(count=Count('images')):
+        category.image_count = category.count
+        category.save(update_fields=['image_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0008_category_collage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='images_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(
+            populate_image_counts, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0009_category_image_count'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='image',
+            index_together=set([('category', 'id')]),
+        ),
+    ]
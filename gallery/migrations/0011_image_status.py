@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0010_image_category_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='raw_photo',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='gallery/uploads'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Waiting to be processed'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Processing failed')], db_index=True, default='ready', max_length=10),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import gallery.storage
+import imagekit.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0011_image_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='photo',
+            field=imagekit.models.fields.ProcessedImageField(blank=True, null=True, storage=gallery.storage.ContentAddressedStorage(), upload_to='gallery'),
+        ),
+    ]
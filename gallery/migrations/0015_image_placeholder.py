@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0014_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='placeholder',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
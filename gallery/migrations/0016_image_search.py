@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def install_search(apps, schema_editor):
+    from gallery.search import install
+    install(schema_editor)
+
+
+def uninstall_search(apps, schema_editor):
+    from gallery.search import uninstall
+    uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0015_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def drop_search_triggers(apps, schema_editor):
+    from gallery.search import drop_sqlite_triggers
+    drop_sqlite_triggers(schema_editor.connection)
+
+
+def create_search_triggers(apps, schema_editor):
+    from gallery.search import ensure_sqlite_triggers
+    ensure_sqlite_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0016_image_search'),
+    ]
+
+    # rebuilding gallery_image on SQLite would break the search triggers
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AddField(
+            model_name='image',
+            name='phash',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
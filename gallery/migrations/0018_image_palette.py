@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def drop_search_triggers(apps, schema_editor):
+    from gallery.search import drop_sqlite_triggers
+    drop_sqlite_triggers(schema_editor.connection)
+
+
+def create_search_triggers(apps, schema_editor):
+    from gallery.search import ensure_sqlite_triggers
+    ensure_sqlite_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0017_image_phash'),
+    ]
+
+    # rebuilding gallery_image on SQLite would break the search triggers
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AddField(
+            model_name='image',
+            name='colour',
+            field=models.CharField(blank=True, editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='palette',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AlterIndexTogether(
+            name='image',
+            index_together=set([('category', 'id'), ('colour', 'category', 'id')]),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
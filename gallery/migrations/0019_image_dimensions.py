@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def drop_search_triggers(apps, schema_editor):
+    from gallery.search import drop_sqlite_triggers
+    drop_sqlite_triggers(schema_editor.connection)
+
+
+def create_search_triggers(apps, schema_editor):
+    from gallery.search import ensure_sqlite_triggers
+    ensure_sqlite_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0018_image_palette'),
+    ]
+
+    # rebuilding gallery_image on SQLite would break the search triggers
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AddField(
+            model_name='image',
+            name='aspect_ratio',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='file_size',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='height',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='width',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
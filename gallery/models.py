@@ -1,16 +1,94 @@
-from django.db import models
-from django.db.models.signals import pre_delete
+import hashlib
+import logging
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import F, Prefetch
+from django.db.models.signals import post_delete, post_migrate, \
+    post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
 
 from django_extensions.db.fields import AutoSlugField
 
-from imagekit.models import ProcessedImageField
+from imagekit.cachefiles import ImageCacheFile
+from imagekit.models import ImageSpecField, ProcessedImageField
+
+from gallery.analysis import analyse_image
+from gallery.cache import forget_category_slug, invalidate_pages
+from gallery.collage import make_collage
+from gallery.deletion import (
+    COLLAGE, RAW_PHOTO, schedule_deletion, schedule_photo_deletion
+)
+from gallery.duplicates import invalidate_index
+from gallery.imagegenerators import Large, Medium, RENDITIONS, \
+    Thumbnail, VARIANT_FORMATS, VARIANT_SPECS
+from gallery.search import ensure_sqlite_triggers
+from gallery.storage import ContentAddressedStorage
+from gallery.utils import TrackedFieldsMixin
+
+
+logger = logging.getLogger(__name__)
+
+
+# number of images shown on an album's cover in the gallery menu
+COVER_IMAGE_COUNT = 4
+
+
+class CategoryQuerySet(models.QuerySet):
+
+    def images_changed(self, count_change=0):
+        """
+        Record that images in these categories have been added (positive
+        count_change), removed (negative) or edited.  Called by the Image
+        signal receivers, and directly by bulk operations that bypass them.
+        """
+        if settings.GALLERY_COVER_COLLAGES:
+            for category_id in self.values_list('id', flat=True):
+                transaction.on_commit(
+                    lambda category_id=category_id:
+                        _refresh_collage(category_id)
+                )
+        changes = {'images_updated_at': timezone.now()}
+        if count_change:
+            changes['image_count'] = F('image_count') + count_change
+        return self.update(**changes)
+
+    def for_menu(self):
+        """
+        Categories for the gallery menu, ordered by name, with
+        `cover_images` (a list of the first COVER_IMAGE_COUNT images)
+        attached.  Always two queries, however many albums there are.
+        """
+        return self.order_by('name').prefetch_related(
+            Prefetch(
+                'images',
+                queryset=Image.objects.first_per_category(COVER_IMAGE_COUNT),
+                to_attr='cover_images'
+            )
+        )
 
 
 class Category(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
     slug = AutoSlugField(populate_from='name', max_length=40, unique=True)
+    # composite of the cover images, only built if
+    # settings.GALLERY_COVER_COLLAGES is on
+    collage = models.ImageField(
+        upload_to='gallery/collages', null=True, blank=True, editable=False
+    )
+    # identifies the cover images the collage was built from
+    collage_key = models.CharField(max_length=32, blank=True, editable=False)
+    # maintained by the Image save/delete signal receivers, so album lists
+    # don't need to count images; see the reconcile_gallery_counts command
+    image_count = models.PositiveIntegerField(default=0, editable=False)
+    images_updated_at = models.DateTimeField(
+        null=True, blank=True, editable=False
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CategoryQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -18,37 +96,372 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = 'categories'
 
+    def refresh_collage(self, force=False):
+        """
+        Rebuild the collage if the cover images have changed since it was
+        last built.
+        """
+        covers = list(self.images.all()[:COVER_IMAGE_COUNT])
+        key = hashlib.md5(
+            ','.join(image.photo.name or '' for image in covers).encode()
+        ).hexdigest() if covers else ''
+        if key == self.collage_key and not force:
+            return
+
+        old_collage = self.collage.name
+        if covers:
+            self.collage.save(
+                '{}.jpg'.format(self.slug),
+                make_collage(image.photo for image in covers),
+                save=False
+            )
+        else:
+            self.collage = None
+        self.collage_key = key
+        self.save(update_fields=['collage', 'collage_key', 'updated_at'])
+        if old_collage != self.collage.name:
+            schedule_deletion(COLLAGE, old_collage)
 
-class Image(models.Model):
 
+class ImageQuerySet(models.QuerySet):
+
+    def first_per_category(self, count):
+        """
+        Limit to the first `count` images (by id) in each category, in a
+        single query.
+        """
+        return self.extra(
+            where=[
+                '(SELECT COUNT(*) FROM gallery_image AS earlier '
+                'WHERE earlier.category_id = gallery_image.category_id '
+                'AND earlier.id < gallery_image.id) < %s'
+            ],
+            params=[count]
+        )
+
+
+class Image(TrackedFieldsMixin, models.Model):
+
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Waiting to be processed'),
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Processing failed'),
+    )
+
+    # stored by content hash, so the same photo in several albums is only
+    # stored once
     photo = ProcessedImageField(
         upload_to='gallery',
         format='JPEG',
         options={'quality': 70},
         null=True, blank=True,
+        storage=ContentAddressedStorage(),
+    )
+    # resized copies of the photo, generated on first use and cached on disk
+    thumbnail = ImageSpecField(source='photo', spec=Thumbnail)
+    medium = ImageSpecField(source='photo', spec=Medium)
+    large = ImageSpecField(source='photo', spec=Large)
+    # unprocessed upload, waiting for the process_gallery_images worker (see
+    # gallery.processing)
+    raw_photo = models.ImageField(
+        upload_to='gallery/uploads', null=True, blank=True, editable=False
     )
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=READY, db_index=True
+    )
+    # derived from the photo whenever it changes (see gallery.analysis)
+    # size of the stored photo
+    width = models.PositiveIntegerField(null=True, editable=False)
+    height = models.PositiveIntegerField(null=True, editable=False)
+    file_size = models.PositiveIntegerField(null=True, editable=False)
+    aspect_ratio = models.FloatField(null=True, editable=False)
+    # tiny inline image shown while the thumbnail loads
+    placeholder = models.TextField(blank=True, editable=False)
+    # perceptual hash, for finding near-duplicates (see gallery.duplicates)
+    phash = models.CharField(max_length=16, blank=True, editable=False)
+    # main colours, and the name of the most common one to browse by
+    palette = models.CharField(max_length=40, blank=True, editable=False)
+    colour = models.CharField(max_length=10, blank=True, editable=False)
 
     category = models.ForeignKey(Category, related_name='images')
     caption = models.CharField(max_length=255, null=True, blank=True)
 
+    objects = ImageQuerySet.as_manager()
+
+    tracked_fields = ('photo', 'category')
+
     class Meta:
         ordering = ('id',)
+        # keyset pagination of albums (see gallery.pagination), and of
+        # images of one colour
+        index_together = (('category', 'id'), ('colour', 'category', 'id'))
 
     def __str__(self):
         return "Photo id: " + str(self.id)
 
+    @property
+    def is_ready(self):
+        return self.status == self.READY
+
+    @property
+    def filename(self):
+        photo = self.photo or self.raw_photo
+        return photo.name.split('/')[-1] if photo else ''
+
+    def rendition_file(self, name, format=None):
+        """
+        The cache file for the named rendition (see
+        gallery.imagegenerators.RENDITIONS), or for its variant in one of
+        the VARIANT_FORMATS
+        """
+        if name not in dict(RENDITIONS):
+            raise ValueError('Unknown rendition {}'.format(name))
+        if format is None:
+            return getattr(self, name)
+        return ImageCacheFile(VARIANT_SPECS[name, format](source=self.photo))
+
+    def generate_renditions(self, force=False):
+        """
+        Generate every rendition and its variants, unless they already exist
+        (or `force`).  Raises if the photo is missing or isn't a readable
+        image (IOError, ValueError, or whatever else Pillow raises for it).
+        """
+        formats = [None] + [format for format, _, _ in VARIANT_FORMATS]
+        for name, _ in RENDITIONS:
+            for format in formats:
+                rendition = self.rendition_file(name, format)
+                # asks the storage, as imagekit's cached file states aren't
+                # cleared when gallery.deletion deletes a rendition
+                if force or not rendition.storage.exists(rendition.name):
+                    rendition.generate(force=True)
+
+    def rendition_url(self, name, format=None):
+        """
+        Return the url for the named rendition, in JPEG or one of the
+        VARIANT_FORMATS.  Renditions are generated when the photo is stored,
+        not here; falls back to the original photo (or for variants, returns
+        '') if the rendition doesn't exist, e.g. if the source file is
+        missing or isn't a readable image.
+
+        Urls are remembered on the instance, as a page (or api response)
+        asks for each of them several times: for the srcsets, the <source>s
+        and the src of an image.
+        """
+        rendition = self.rendition_file(name, format)
+        if not self.photo:
+            return ''
+        key = (self.photo.name, name, format)
+        urls = self.__dict__.setdefault('_rendition_urls', {})
+        if key not in urls:
+            if rendition:  # checks the file exists, see Pregenerated
+                urls[key] = rendition.url
+            else:
+                logger.warning(
+                    'No %s %s rendition for image %s (%s)',
+                    name, format or 'JPEG', self.id, self.photo.name
+                )
+                urls[key] = '' if format else self.photo.url
+        return urls[key]
+
+    def rendition_size(self, name):
+        """
+        (width, height) of the named rendition, worked out from the stored
+        photo dimensions, or None if they aren't known
+        """
+        if not (self.width and self.height):
+            return None
+        spec = dict(RENDITIONS)[name]
+        # renditions fit within the spec's size, and are never upscaled
+        scale = min(spec.width / self.width, spec.height / self.height, 1)
+        return (
+            int(round(self.width * scale)), int(round(self.height * scale))
+        )
+
+    def rendition_sources(self, name):
+        """
+        (mime type, url) for each variant of the named rendition, best first
+        """
+        sources = []
+        for format, mime_type, _ in VARIANT_FORMATS:
+            url = self.rendition_url(name, format)
+            if url:
+                sources.append((mime_type, url))
+        return sources
+
+    def rendition_srcset(self, format=None):
+        """
+        A srcset of every rendition, in JPEG or one of the VARIANT_FORMATS,
+        with its width, for the browser to pick the smallest that's big
+        enough.  Widths are the spec's until the photo has been measured.
+        """
+        candidates = []
+        widths = set()
+        for name, spec in RENDITIONS:
+            size = self.rendition_size(name)
+            width = size[0] if size else spec.width
+            if width in widths:
+                # renditions aren't upscaled, so for small photos the
+                # larger ones are the same as a smaller one
+                continue
+            url = self.rendition_url(name, format)
+            if url:
+                widths.add(width)
+                candidates.append('{} {}w'.format(url, width))
+        return ', '.join(candidates)
+
+    def variant_srcsets(self):
+        """
+        (mime type, srcset) for each of the VARIANT_FORMATS, best first
+        """
+        srcsets = []
+        for format, mime_type, _ in VARIANT_FORMATS:
+            srcset = self.rendition_srcset(format)
+            if srcset:
+                srcsets.append((mime_type, srcset))
+        return srcsets
+
     def save(self, *args, **kwargs):
-        # delete old image file when replacing by updating the file
-        try:
-            this = Image.objects.get(id=self.id)
-            if this.photo != self.photo:
-                this.photo.delete(save=False)
-        except Image.DoesNotExist:
-            pass  # when new photo then we do nothing, normal case
+        old_photo = self.get_loaded_value('photo')
+        update_fields = kwargs.get('update_fields')
+        analyse = bool(self.photo) and self.has_field_changed('photo') and \
+            (update_fields is None or 'photo' in update_fields)
         super(Image, self).save(*args, **kwargs)
+        # delete old image file when replacing by updating the file, once
+        # the change is committed
+        if old_photo and old_photo != self.photo.name:
+            schedule_photo_deletion(old_photo)
+        if analyse:
+            # once the photo has been saved to storage
+            self.analyse_photo()
+            try:
+                self.generate_renditions()
+            except Exception as e:  # pages fall back to the photo
+                logger.warning(
+                    'Could not generate renditions for image %s (%s): %s',
+                    self.id, self.photo.name, e
+                )
+
+    def analyse_photo(self, only=None):
+        """
+        Update the fields derived from the photo (see gallery.analysis)
+        """
+        previous_phash = self.phash
+        values = analyse_image(self, only)
+        if values:
+            for field, value in values.items():
+                setattr(self, field, value)
+            Image.objects.filter(id=self.id).update(**values)
+            # changes the album's pages, and so their ETags
+            _update_image_count(self.category_id, 0)
+            if values.get('phash', previous_phash) != previous_phash and (
+                previous_phash or
+                Image.objects.filter(id__gt=self.id).exclude(phash='').exists()
+            ):
+                # the duplicates indexes may hold the old hash, or have
+                # been brought up to date past this image
+                invalidate_index()
+
+
+class FileDeletionFailure(models.Model):
+    """
+    A media file that couldn't be deleted after its image or album was
+    deleted; retried by the retry_gallery_file_deletions command.
+    """
+    kind = models.CharField(max_length=20)
+    name = models.CharField(max_length=255)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{} {}'.format(self.kind, self.name)
+
+
+def _update_image_count(category_id, change):
+    Category.objects.filter(id=category_id).images_changed(change)
+    invalidate_pages([category_id])
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_pages([instance.id])
+    forget_category_slug(instance.slug)
+
+
+def _categories_being_deleted(using):
+    """
+    Ids of the categories whose deletion is under way on the `using`
+    connection (the deletion collector sends every pre_delete before any
+    post_delete)
+    """
+    connection = connections[using]
+    if not hasattr(connection, 'gallery_deleting_categories'):
+        connection.gallery_deleting_categories = set()
+    return connection.gallery_deleting_categories
+
+
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # loaded values are still those from before the save
+    previous_category_id = instance.get_loaded_value('category')
+    if created:
+        _update_image_count(instance.category_id, 1)
+    elif previous_category_id and \
+            previous_category_id != instance.category_id:
+        _update_image_count(previous_category_id, -1)
+        _update_image_count(instance.category_id, 1)
+    else:
+        # an edit; the count is unchanged, but the album's pages aren't
+        _update_image_count(instance.category_id, 0)
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted(sender, instance, using, **kwargs):
+    # when the category is being deleted too, there's no count to update,
+    # and category_deleted invalidates its pages (and the duplicates
+    # indexes) once
+    if instance.category_id not in _categories_being_deleted(using):
+        _update_image_count(instance.category_id, -1)
+        if instance.phash:
+            invalidate_index()
+    schedule_photo_deletion(instance.photo.name)
+    schedule_deletion(RAW_PHOTO, instance.raw_photo.name)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, using, **kwargs):
+    _categories_being_deleted(using).add(instance.id)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, using, **kwargs):
+    _categories_being_deleted(using).discard(instance.id)
+    schedule_deletion(COLLAGE, instance.collage.name)
+    invalidate_pages([instance.id])
+    invalidate_index()
+    forget_category_slug(instance.slug)
+
+
+@receiver(post_migrate)
+def search_index_migrated(sender, using, **kwargs):
+    # rebuilding gallery_image in a later sqlite migration drops the search
+    # index triggers
+    connection = connections[using]
+    if sender.label == 'gallery' and connection.vendor == 'sqlite':
+        ensure_sqlite_triggers(connection)
 
 
-@receiver(pre_delete)
-def delete_image(sender, instance, **kwargs):
-    if sender == Image:
-        instance.photo.delete()
+def _refresh_collage(category_id):
+    category = Category.objects.filter(id=category_id).first()
+    if category:  # category may have been deleted along with its images
+        category.refresh_collage()
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(image):
+    if isinstance(image, dict):  # from a values() queryset
+        return '{}-{}'.format(image['category_id'], image['id'])
+    return '{}-{}'.format(image.category_id, image.id)
+
+
+def decode_cursor(cursor):
+    try:
+        category_id, image_id = [int(part) for part in cursor.split('-')]
+    except (AttributeError, ValueError):
+        raise InvalidCursor('Invalid cursor {}'.format(cursor))
+    return category_id, image_id
+
+
+class ImagePage(object):
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginate_images(queryset, cursor=None, page_size=None):
+    """
+    Keyset pagination of images, ordered by (category_id, id).
+
+    `cursor` is the value of `next_cursor` from the previous page; the page
+    starts immediately after the image it identifies.  Rather than using
+    OFFSET (which has to scan every preceding row), each page is a range
+    query on the (category, id) index, so later pages cost the same as the
+    first.
+    """
+    page_size = page_size or settings.GALLERY_PAGE_SIZE
+    queryset = queryset.order_by('category_id', 'id')
+    if cursor:
+        category_id, image_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(category_id__gt=category_id) |
+            Q(category_id=category_id, id__gt=image_id)
+        )
+
+    # fetch one extra to find out if there's another page
+    images = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(images) > page_size:
+        images = images[:page_size]
+        next_cursor = encode_cursor(images[-1])
+    return ImagePage(images, next_cursor)
@@ -0,0 +1,113 @@
+"""
+Background processing of gallery uploads.
+
+With settings.GALLERY_DEFER_PROCESSING on, the album edit page stores
+uploads unprocessed in Image.raw_photo with a status of PENDING, so the
+request doesn't wait for the JPEG re-encode.  The process_gallery_images
+management command (run as a worker process, see the Procfile) claims
+pending images from the database and processes them here.
+"""
+import logging
+import os
+import time
+
+from django.core.files import File
+from django.db import DatabaseError, transaction
+
+from gallery.deletion import schedule_photo_deletion
+from gallery.duplicates import find_duplicates_of
+from gallery.models import Image
+
+
+logger = logging.getLogger(__name__)
+
+
+def claim_next_image():
+    """
+    Mark the oldest pending image as PROCESSING and return it, or None if
+    there are no pending images.  The status change is a conditional
+    UPDATE, so concurrent workers never claim the same image.
+    """
+    pending = Image.objects.filter(status=Image.PENDING).order_by('id')
+    for image_id in pending.values_list('id', flat=True)[:10]:
+        claimed = Image.objects.filter(
+            id=image_id, status=Image.PENDING
+        ).update(status=Image.PROCESSING)
+        if claimed:
+            return Image.objects.get(id=image_id)
+    return None
+
+
+def regenerate_image_renditions(args):
+    """
+    Regenerate every rendition of an (image id, photo name, force), e.g.
+    after the rendition specs have changed, or only those that are missing
+    unless `force`.  Runs in the worker processes of the
+    regenerate_gallery_renditions command, which only touch files.  Returns
+    (image id, seconds taken, error or None).
+    """
+    image_id, photo_name, force = args
+    started = time.time()
+    try:
+        Image(id=image_id, photo=photo_name).generate_renditions(force=force)
+    except Exception as e:  # a bad photo mustn't stop the command
+        return image_id, time.time() - started, str(e) or repr(e)
+    return image_id, time.time() - started, None
+
+
+def process_image(image):
+    """
+    Encode the raw upload into the image's photo (replacing any previous
+    photo) and mark it READY; saving the photo generates its renditions.
+    Returns True if processing succeeded.  Only the fields processing sets
+    are saved, so edits made meanwhile (e.g. to the caption) are kept.
+    """
+    raw_photo = image.raw_photo
+    try:
+        raw_photo.open('rb')
+        try:
+            # ProcessedImageField re-encodes the content as it is saved
+            image.photo.save(
+                os.path.basename(raw_photo.name), File(raw_photo), save=False
+            )
+        finally:
+            raw_photo.close()
+    except Exception:  # never let one upload stop the worker
+        logger.exception('Processing failed for image %s', image.id)
+        Image.objects.filter(id=image.id).update(status=Image.FAILED)
+        return False
+
+    image.raw_photo = None
+    image.status = Image.READY
+    try:
+        with transaction.atomic():
+            image.save(update_fields=['photo', 'raw_photo', 'status'])
+    except DatabaseError:
+        # the image was deleted while it was being processed
+        logger.info('Image %s was deleted during processing', image.id)
+        schedule_photo_deletion(image.photo.name)
+        return False
+    raw_photo.delete(save=False)
+    logger.info('Processed image %s (%s)', image.id, image.photo.name)
+    for duplicate in find_duplicates_of([image]).get(image, []):
+        logger.warning(
+            'Image %s (album %s) looks like a duplicate of image %s '
+            '(album %s)',
+            image.id, image.category_id, duplicate.id, duplicate.category_id
+        )
+    return True
+
+
+def process_pending_images(limit=None):
+    """
+    Process pending images until there are none left (or `limit` have been
+    processed).  Returns the number of images processed.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        image = claim_next_image()
+        if image is None:
+            break
+        process_image(image)
+        processed += 1
+    return processed
@@ -0,0 +1,208 @@
+"""
+Full text search of image captions and album names and descriptions.
+
+On Postgres each gallery_image row has a `search_vector` tsvector column
+with a GIN index, kept up to date by triggers (an album's name and
+description are included in each of its images' vectors).  On SQLite
+(local development) the same text is indexed in an FTS4 table,
+gallery_image_fts, again maintained by triggers.  Neither is a model
+field; both are created by migration 0016.  Other databases fall back to
+icontains filters.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+
+POSTGRES_INSTALL = [
+    "ALTER TABLE gallery_image ADD COLUMN search_vector tsvector",
+    "CREATE INDEX gallery_image_search_vector ON gallery_image "
+    "USING gin(search_vector)",
+    """
+    CREATE OR REPLACE FUNCTION gallery_image_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.caption, '')), 'A')
+            || setweight(to_tsvector('english', coalesce((
+                SELECT name || ' ' || coalesce(description, '')
+                FROM gallery_category WHERE id = NEW.category_id
+            ), '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "CREATE TRIGGER gallery_image_search_vector_update "
+    "BEFORE INSERT OR UPDATE OF caption, category_id ON gallery_image "
+    "FOR EACH ROW EXECUTE PROCEDURE gallery_image_search_vector_update()",
+    """
+    CREATE OR REPLACE FUNCTION gallery_category_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        IF NEW.name IS DISTINCT FROM OLD.name OR
+                NEW.description IS DISTINCT FROM OLD.description THEN
+            -- fires the image trigger
+            UPDATE gallery_image SET caption = caption
+            WHERE category_id = NEW.id;
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "CREATE TRIGGER gallery_category_search_vector_update "
+    "AFTER UPDATE ON gallery_category "
+    "FOR EACH ROW EXECUTE PROCEDURE gallery_category_search_vector_update()",
+    "UPDATE gallery_image SET caption = caption",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS gallery_category_search_vector_update "
+    "ON gallery_category",
+    "DROP FUNCTION IF EXISTS gallery_category_search_vector_update()",
+    "DROP TRIGGER IF EXISTS gallery_image_search_vector_update "
+    "ON gallery_image",
+    "DROP FUNCTION IF EXISTS gallery_image_search_vector_update()",
+    "ALTER TABLE gallery_image DROP COLUMN IF EXISTS search_vector",
+]
+
+_SQLITE_INDEX_IMAGE = """
+    INSERT INTO gallery_image_fts(docid, caption, category)
+    SELECT NEW.id, coalesce(NEW.caption, ''),
+           name || ' ' || coalesce(description, '')
+    FROM gallery_category WHERE id = NEW.category_id;
+"""
+
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS gallery_image_fts_insert "
+    "AFTER INSERT ON gallery_image BEGIN" + _SQLITE_INDEX_IMAGE + "END",
+    "CREATE TRIGGER IF NOT EXISTS gallery_image_fts_update "
+    "AFTER UPDATE OF caption, category_id ON gallery_image BEGIN "
+    "DELETE FROM gallery_image_fts WHERE docid = OLD.id;" +
+    _SQLITE_INDEX_IMAGE + "END",
+    "CREATE TRIGGER IF NOT EXISTS gallery_image_fts_delete "
+    "AFTER DELETE ON gallery_image BEGIN "
+    "DELETE FROM gallery_image_fts WHERE docid = OLD.id; END",
+    "CREATE TRIGGER IF NOT EXISTS gallery_category_fts_update "
+    "AFTER UPDATE OF name, description ON gallery_category BEGIN "
+    "UPDATE gallery_image_fts "
+    "SET category = NEW.name || ' ' || coalesce(NEW.description, '') "
+    "WHERE docid IN "
+    "(SELECT id FROM gallery_image WHERE category_id = NEW.id); END",
+]
+
+SQLITE_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS " + name for name in (
+        'gallery_image_fts_insert', 'gallery_image_fts_update',
+        'gallery_image_fts_delete', 'gallery_category_fts_update',
+    )
+]
+
+SQLITE_REINDEX = [
+    "DELETE FROM gallery_image_fts",
+    "INSERT INTO gallery_image_fts(docid, caption, category) "
+    "SELECT image.id, coalesce(image.caption, ''), "
+    "category.name || ' ' || coalesce(category.description, '') "
+    "FROM gallery_image image "
+    "JOIN gallery_category category ON category.id = image.category_id",
+]
+
+
+def install(schema_editor=None):
+    """
+    Create the search index for the current database, if it supports one
+    """
+    conn = schema_editor.connection if schema_editor else connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for sql in POSTGRES_INSTALL:
+                cursor.execute(sql)
+        elif conn.vendor == 'sqlite':
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS gallery_image_fts "
+                "USING fts4(caption, category, tokenize=porter)"
+            )
+            ensure_sqlite_triggers(conn)
+
+
+def uninstall(schema_editor=None):
+    conn = schema_editor.connection if schema_editor else connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for sql in POSTGRES_UNINSTALL:
+                cursor.execute(sql)
+        elif conn.vendor == 'sqlite':
+            for sql in SQLITE_DROP_TRIGGERS:
+                cursor.execute(sql)
+            cursor.execute("DROP TABLE IF EXISTS gallery_image_fts")
+
+
+def drop_sqlite_triggers(conn=connection):
+    """
+    Drop the SQLite search index triggers, ahead of a migration that
+    rebuilds gallery_image or gallery_category (as SQLite migrations do to
+    add or alter a column).  The rebuild renames the table to "<name>__old",
+    and SQLite 3.26+ rewrites the triggers to refer to the renamed table,
+    which the rebuild then drops; a trigger left referring to it makes the
+    migration fail.  ensure_sqlite_triggers recreates them afterwards.
+    """
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for sql in SQLITE_DROP_TRIGGERS:
+            cursor.execute(sql)
+
+
+def ensure_sqlite_triggers(conn=connection):
+    """
+    SQLite drops a table's triggers when a migration rebuilds the table, so
+    (re)create any that are missing, and reindex if they were.  Run after
+    the migrations that drop them (see drop_sqlite_triggers), and after
+    every migrate.
+    """
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, count(*) FROM sqlite_master "
+            "WHERE name LIKE 'gallery_%_fts%' GROUP BY type"
+        )
+        counts = dict(cursor.fetchall())
+        if not counts.get('table') or \
+                counts.get('trigger') == len(SQLITE_TRIGGERS):
+            return  # not installed (yet), or nothing to do
+        for sql in SQLITE_TRIGGERS + SQLITE_REINDEX:
+            cursor.execute(sql)
+
+
+def search_images(queryset, query):
+    """
+    Filter an Image queryset to those matching a search query (all of its
+    words, in the caption or the album name or description)
+    """
+    words = re.findall(r'\w+', query, re.UNICODE)
+    if not words:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        return queryset.extra(
+            where=[
+                "gallery_image.search_vector @@ "
+                "plainto_tsquery('english', %s)"
+            ],
+            params=[' '.join(words)]
+        )
+    if connection.vendor == 'sqlite':
+        return queryset.extra(
+            where=[
+                "gallery_image.id IN (SELECT docid FROM gallery_image_fts "
+                "WHERE gallery_image_fts MATCH %s)"
+            ],
+            # prefix match each word, so partial words find results too
+            params=[' '.join(word + '*' for word in words)]
+        )
+    for word in words:
+        queryset = queryset.filter(
+            Q(caption__icontains=word) | Q(category__name__icontains=word) |
+            Q(category__description__icontains=word)
+        )
+    return queryset
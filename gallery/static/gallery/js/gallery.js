@@ -37,31 +37,108 @@ $(document).ready(function(){
             updateGallery(selector);
         });
 
+        // Point a copy of the modal's <picture> at a thumbnail's photo: its
+        // sources offer the smaller formats the browser supports, falling
+        // back to the jpeg, each with every rendition for the browser to
+        // pick the size the modal needs at this viewport from
+        function setPicture($picture, $sel) {
+            $picture.find('source').each(function() {
+                $(this).attr('srcset', $sel.data('srcset-' + $(this).data('format')) || '');
+            });
+            $picture.find('img')
+                .attr('srcset', $sel.data('srcset') || '')
+                .attr('src', $sel.data('image'));
+        }
+
+        // The photos either side of the one shown are loaded and decoded
+        // ahead of time, in copies of the modal's <picture> (so the browser
+        // picks the same format and rendition for them) kept in a hidden
+        // container.  The most recently used few are kept, so stepping
+        // back and forth doesn't wait on the network or on decoding.
+        var PREFETCH_CACHE_SIZE = 6,
+            prefetched = [],  // {url, $picture}, least recently used first
+            $prefetchContainer = $('<div id="image-gallery-prefetch" aria-hidden="true"></div>')
+                .appendTo('body');
+
+        function prefetch($sel) {
+            var url = $sel.data('image');
+            if (!url) {
+                return;
+            }
+            for (var i = 0; i < prefetched.length; i++) {
+                if (prefetched[i].url === url) {
+                    prefetched.push(prefetched.splice(i, 1)[0]);
+                    return;
+                }
+            }
+            var $picture = $('#image-gallery-picture').clone().removeAttr('id');
+            $picture.find('img').removeAttr('id');
+            setPicture($picture, $sel);
+            $prefetchContainer.append($picture);
+            var img = $picture.find('img')[0];
+            if (img.decode) {
+                // decoded off the main thread; a failed load is shown (or
+                // retried) when the photo itself is opened
+                img.decode().catch(function() {});
+            }
+            prefetched.push({url: url, $picture: $picture});
+            if (prefetched.length > PREFETCH_CACHE_SIZE) {
+                prefetched.shift().$picture.remove();
+            }
+        }
+
+        function prefetchNeighbours(image_id) {
+            prefetch($('[data-image-id="' + (image_id + 1) + '"]'));
+            prefetch($('[data-image-id="' + (image_id - 1) + '"]'));
+        }
+
         function updateGallery(selector) {
-            var $sel = selector;
-            current_image = $sel.data('image-id');
+            var $sel = selector,
+                image_id = $sel.data('image-id'),
+                img = $('#image-gallery-image')[0];
+            current_image = image_id;
             $('#image-gallery-caption').text($sel.data('caption'));
             $('#image-gallery-title').text($sel.data('title'));
-            $('#image-gallery-image').attr('src', $sel.data('image'));
-            disableButtons(counter, $sel.data('image-id'));
+            // keep the photo being shown in the cache too
+            prefetch($sel);
+            setPicture($('#image-gallery-picture'), $sel);
+            disableButtons(counter, image_id);
+            // don't compete with the photo being shown for bandwidth
+            if (img.decode) {
+                img.decode().then(function() {
+                    prefetchNeighbours(image_id);
+                }, function() {
+                    prefetchNeighbours(image_id);
+                });
+            } else {
+                prefetchNeighbours(image_id);
+            }
         }
 
-        if(setIDs == true){
-            $('[data-image-id]').each(function(){
+        // number any thumbnails that don't have an id yet
+        function setImageIDs(){
+            $('[data-image-id=""]').each(function(){
                 counter++;
                 $(this).attr('data-image-id',counter);
             });
         }
-        $(setClickAttr).on('click',function(){
+
+        if(setIDs == true){
+            setImageIDs();
+            // thumbnails added by infinite scrolling
+            $(document).on('gallery:images-added', setImageIDs);
+        }
+        $(document).on('click', setClickAttr, function(){
             updateGallery($(this));
         });
     }
 
-    jQuery(function($) {
-        $('img').one('load', function () {
+    function detectPortraits($imgs) {
+        $imgs.one('load', function () {
             var $img = $(this);
             var tempImage1 = new Image();
-            tempImage1.src = $img.attr('src');
+            // the source the browser chose from any <picture>
+            tempImage1.src = this.currentSrc || $img.attr('src');
             tempImage1.onload = function() {
                 var ratio = tempImage1.width / tempImage1.height;
                 if(!isNaN(ratio) && ratio < 1) $img.addClass('portrait');
@@ -69,8 +146,86 @@ $(document).ready(function(){
         }).each(function () {
             if (this.complete) $(this).load();
         });
+    }
+
+    jQuery(function($) {
+        detectPortraits($('img'));
     });
 
+    // Infinite scrolling of album pages; the grid's data-next-url is the
+    // json endpoint for the next page of images
+    function thumbnailElement(image) {
+        // as the cover_sizes template filter: landscape photos fill the
+        // 150px thumbnail's height, so are shown wider than it
+        var ratio = image.width && image.height ? image.width / image.height : 1,
+            sizes = Math.round(150 * Math.max(ratio, 1)) + 'px',
+            $picture = $('<picture></picture>');
+        $.each(image.variant_srcsets, function(i, source) {
+            $picture.append($('<source>').attr('type', source.type)
+                .attr('srcset', source.srcset).attr('sizes', sizes));
+        });
+        $picture.append($('<img>').attr({
+            src: image.thumbnail,
+            srcset: image.srcset,
+            sizes: sizes,
+            loading: 'lazy',
+            decoding: 'async',
+            alt: image.caption
+        }));
+        var $container = $('<div class="thumbnail-container"></div>').append($picture);
+        if (image.placeholder) {
+            $container.css('background-image', 'url(' + image.placeholder + ')');
+        }
+        var $link = $('<a href="#" class="gallery-thumbnail" data-image-id="" ' +
+                      'data-toggle="modal" data-target="#image-gallery"></a>')
+            .attr('data-title', image.category)
+            .attr('data-caption', image.caption)
+            .attr('data-image', image.large)
+            .attr('data-srcset', image.srcset)
+            .append($container);
+        $.each(image.variant_srcsets, function(i, source) {
+            $link.attr('data-srcset-' + source.type.replace('image/', ''), source.srcset);
+        });
+        return $('<div class="col-lg-3 col-md-4 col-xs-6"></div>').append($link);
+    }
+
+    function loadMoreImages() {
+        var $grid = $('#image-grid'),
+            nextUrl = $grid.data('next-url');
+        if (!nextUrl || $grid.data('loading')) {
+            return;
+        }
+        $grid.data('loading', true);
+        $.getJSON(nextUrl, function(page) {
+            var $items = $.map(page.images, thumbnailElement);
+            $grid.append($items);
+            $.each($items, function(i, $item) {
+                detectPortraits($item.find('img'));
+            });
+            if (page.next_cursor) {
+                $grid.data('next-url', nextUrl.replace(/after=[^&]*/, 'after=' + page.next_cursor));
+            } else {
+                $grid.data('next-url', '');
+                $('#load-more-images').remove();
+            }
+            $(document).trigger('gallery:images-added');
+        }).always(function() {
+            $grid.data('loading', false);
+        });
+    }
+
+    if ($('#image-grid').length) {
+        $('#load-more-images').click(function(event) {
+            event.preventDefault();
+            loadMoreImages();
+        });
+        $(window).scroll(function() {
+            if ($(window).scrollTop() + $(window).height() > $(document).height() - 400) {
+                loadMoreImages();
+            }
+        });
+    }
+
     //http://tablesorter.com/docs/
     jQuery("#sortTable").tablesorter();
-});
\ No newline at end of file
+});
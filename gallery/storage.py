@@ -0,0 +1,74 @@
+import hashlib
+import os
+import posixpath
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.signals import setting_changed
+from django.utils._os import abspathu
+from django.utils.deconstruct import deconstructible
+
+from gallery.deletion import lock_photo_files
+
+
+def content_hash(content):
+    sha = hashlib.sha1()
+    for chunk in content.chunks():
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def is_content_addressed(name):
+    """
+    True if `name` is in the layout ContentAddressedStorage saves to,
+    i.e. <upload dir>/<2 hex chars>/<40 char hex sha1><ext>
+    """
+    directory, filename = posixpath.split(name)
+    digest = os.path.splitext(filename)[0]
+    return len(digest) == 40 and posixpath.basename(directory) == digest[:2]
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names each file after the sha1 of its content,
+    so identical files are only stored once.  Saving content that is
+    already stored returns the existing name without writing anything.
+
+    Several model instances may therefore share a file; deleting it is left
+    to gallery.deletion, once it is no longer referenced.  Saves should be
+    made in the transaction that saves the image referring to the file
+    (as Image.save does), which holds the photo files lock until then, so a
+    pending deletion can't remove a file that is being reused.
+
+    The instance is made when the models are imported, so unless a location
+    or base_url is given it follows changes to MEDIA_ROOT and MEDIA_URL
+    (FileSystemStorage only reads them once, in __init__).
+    """
+
+    def __init__(self, location=None, base_url=None, **kwargs):
+        super(ContentAddressedStorage, self).__init__(
+            location=location, base_url=base_url, **kwargs
+        )
+        self._follow_media_root = location is None
+        self._follow_media_url = base_url is None
+        setting_changed.connect(self._media_setting_changed)
+
+    def _media_setting_changed(self, setting, **kwargs):
+        if setting == 'MEDIA_ROOT' and self._follow_media_root:
+            self.base_location = settings.MEDIA_ROOT
+            self.location = abspathu(self.base_location)
+        elif setting == 'MEDIA_URL' and self._follow_media_url:
+            self.base_url = settings.MEDIA_URL
+
+    def _save(self, name, content):
+        digest = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(
+            posixpath.dirname(name), digest[:2], digest + extension
+        )
+        lock_photo_files()
+        if self.exists(name):
+            return name
+        content.seek(0)
+        return super(ContentAddressedStorage, self)._save(name, content)
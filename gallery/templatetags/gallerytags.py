@@ -1,4 +1,7 @@
 from django import template
+from django.utils.html import format_html_join
+
+from gallery.imagegenerators import VARIANT_FORMATS
 
 register = template.Library()
 
@@ -7,3 +10,68 @@ register = template.Library()
 def format_field_name(field):
     return field.replace('_', ' ').title()
 
+
+@register.filter
+def rendition(image, name):
+    """
+    Url for a gallery image rendition, e.g. {{ image|rendition:'thumbnail' }}
+    """
+    return image.rendition_url(name)
+
+
+@register.filter
+def rendition_size(image, name):
+    """
+    (width, height) of a rendition, from the stored photo dimensions, or
+    None if they aren't known yet
+    """
+    return image.rendition_size(name)
+
+
+@register.filter
+def rendition_sources(image, name):
+    """
+    (mime type, url) for each of a rendition's smaller format variants, for
+    <picture> <source>s
+    """
+    return image.rendition_sources(name)
+
+
+@register.filter
+def cover_sizes(image, box):
+    """
+    `sizes` for an image covering a square `box` px wide, as in a
+    .thumbnail-container, where landscape photos fill its height and so are
+    shown wider than the box, e.g. {{ image|cover_sizes:150 }}
+    """
+    ratio = image.aspect_ratio or 1
+    return '{}px'.format(int(round(box * max(ratio, 1))))
+
+
+@register.simple_tag
+def responsive_img_attrs(image, rendition, sizes='100vw'):
+    """
+    src, srcset, sizes, width and height attributes of an <img> for a
+    gallery image, loaded lazily and decoded off the main thread.  src (and
+    width and height) are the named rendition's, for browsers without
+    srcset support, e.g.
+    <img {% responsive_img_attrs image 'thumbnail' '150px' %} alt="">
+    """
+    attrs = [
+        ('src', image.rendition_url(rendition)),
+        ('srcset', image.rendition_srcset()),
+        ('sizes', sizes),
+    ]
+    size = image.rendition_size(rendition)
+    if size:
+        attrs.extend([('width', size[0]), ('height', size[1])])
+    attrs.extend([('loading', 'lazy'), ('decoding', 'async')])
+    return format_html_join(' ', '{}="{}"', attrs)
+
+
+@register.simple_tag
+def variant_types():
+    """
+    Mime types of the rendition format variants, best first
+    """
+    return [mime_type for _, mime_type, _ in VARIANT_FORMATS]
@@ -1,8 +1,23 @@
+import os
+import shutil
+
+from io import BytesIO
+from tempfile import mkdtemp
+
 from model_mommy import mommy
 from django.contrib.sites.models import Site
 from django.conf import settings
 from importlib import import_module
-from django.test import RequestFactory
+from django.test import RequestFactory, override_settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from PIL import Image as PILImage
+
+
+TEST_JPG = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'testjpg.jpg'
+)
 
 
 def set_up_fb():
@@ -11,6 +26,19 @@ def set_up_fb():
     fbapp.sites.add(site.id)
 
 
+def use_temp_media_root(testcase):
+    """
+    Point MEDIA_ROOT at a new temporary directory for the rest of the test,
+    removing it (and everything the test stored) afterwards.
+    """
+    media_root = mkdtemp()
+    testcase.addCleanup(shutil.rmtree, media_root)
+    settings_override = override_settings(MEDIA_ROOT=media_root)
+    settings_override.enable()
+    testcase.addCleanup(settings_override.disable)
+    return media_root
+
+
 def _create_session():
     # create session
     settings.SESSION_ENGINE = 'django.contrib.sessions.backends.db'
@@ -29,3 +57,14 @@ def setup_view(view, request, *args, **kwargs):
     view.args = args
     view.kwargs = kwargs
     return view
+
+
+def make_photo():
+    with open(TEST_JPG, 'rb') as file:
+        return SimpleUploadedFile('testjpg.jpg', content=file.read())
+
+
+def make_solid_photo(colour, size=(40, 30), name='solid.jpg'):
+    output = BytesIO()
+    PILImage.new('RGB', size, colour).save(output, format='JPEG')
+    return ContentFile(output.getvalue(), name=name)
@@ -0,0 +1,185 @@
+import base64
+
+from io import BytesIO
+
+from mock import patch
+from model_mommy import mommy
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from PIL import Image as PILImage
+
+from gallery.analysis import PLACEHOLDER_SIZE, backfill, colour_name
+from gallery.importer import import_images
+from gallery.models import Category, Image
+from gallery.tests.helpers import make_photo, make_solid_photo, set_up_fb, \
+    use_temp_media_root
+from gallery.tests.test_importer import make_zip
+
+
+def decode_placeholder(placeholder):
+    prefix = 'data:image/jpeg;base64,'
+    assert placeholder.startswith(prefix)
+    return PILImage.open(BytesIO(base64.b64decode(placeholder[len(prefix):])))
+
+
+class PlaceholderTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='placeholders')
+
+    def test_placeholder_made_when_photo_saved(self):
+        image = Image.objects.create(
+            category=self.category, photo=make_solid_photo('red', (400, 200))
+        )
+        image.refresh_from_db()
+        placeholder = decode_placeholder(image.placeholder)
+        self.assertEqual(placeholder.size, (PLACEHOLDER_SIZE, 10))
+        red, green, blue = placeholder.convert('RGB').getpixel((5, 5))
+        self.assertGreater(red, 200)
+        self.assertLess(green, 50)
+
+    def test_dimensions_stored(self):
+        image = Image.objects.create(
+            category=self.category, photo=make_solid_photo('red', (400, 200))
+        )
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (400, 200))
+        self.assertEqual(image.aspect_ratio, 2)
+        self.assertEqual(image.file_size, image.photo.size)
+        # renditions fit within their size, and aren't upscaled
+        self.assertEqual(image.rendition_size('thumbnail'), (320, 160))
+        self.assertEqual(image.rendition_size('large'), (400, 200))
+
+        resp = self.client.get(
+            reverse('gallery:category', args=[self.category.slug])
+        )
+        self.assertIn('width="320" height="160"', resp.content.decode())
+
+    def test_placeholder_remade_when_photo_replaced(self):
+        image = Image.objects.create(
+            category=self.category, photo=make_solid_photo('red')
+        )
+        placeholder = image.placeholder
+        image.photo = make_solid_photo('blue')
+        image.save()
+        image.refresh_from_db()
+        self.assertNotEqual(image.placeholder, placeholder)
+
+    def test_unreadable_photo_has_no_placeholder(self):
+        image = mommy.make(Image, category=self.category, photo='missing.jpg')
+        image.refresh_from_db()
+        self.assertEqual(image.placeholder, '')
+
+    def test_imported_images_have_placeholders(self):
+        import_images(self.category, make_zip(), processes=1)
+        self.assertEqual(self.category.images.count(), 2)
+        for image in self.category.images.all():
+            decode_placeholder(image.placeholder)
+
+    def test_placeholder_inlined_in_album_page(self):
+        image = Image.objects.create(category=self.category, photo=make_photo())
+        image.refresh_from_db()
+        resp = self.client.get(
+            reverse('gallery:category', args=[self.category.slug])
+        )
+        self.assertIn(image.placeholder, resp.content.decode())
+
+    def test_backfill(self):
+        for colour in ('red', 'green', 'blue'):
+            Image.objects.create(
+                category=self.category, photo=make_solid_photo(colour)
+            )
+        Image.objects.update(placeholder='', width=None)
+        Image.objects.filter(
+            id=Image.objects.first().id
+        ).update(photo='missing.jpg')
+        self.category.refresh_from_db()
+        images_updated_at = self.category.images_updated_at
+
+        self.assertEqual(backfill(processes=2, batch_size=2), (2, 1))
+        self.assertEqual(Image.objects.filter(placeholder='').count(), 1)
+        # the album's pages have changed, and so must their ETags
+        self.category.refresh_from_db()
+        self.assertGreater(
+            self.category.images_updated_at, images_updated_at
+        )
+        self.assertEqual(Image.objects.filter(width__isnull=True).count(), 1)
+
+        out = StringIO()
+        call_command(
+            'backfill_gallery_images', '--only', 'placeholder',
+            '--processes', '1', stdout=out
+        )
+        # only the unreadable image is left to try
+        self.assertIn('0 image(s) updated, 1 failed', out.getvalue())
+
+    def test_backfill_survives_decoder_errors(self):
+        for colour in ('red', 'green'):
+            Image.objects.create(
+                category=self.category, photo=make_solid_photo(colour)
+            )
+        Image.objects.update(placeholder='')
+        # e.g. what Pillow raises for some broken PNGs
+        with patch(
+                'gallery.analysis.analyse', side_effect=SyntaxError('broken')
+        ):
+            self.assertEqual(backfill(processes=1, batch_size=1), (0, 2))
+
+
+class PaletteTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='colours')
+
+    def test_colour_names(self):
+        for rgb, name in [
+            ((250, 10, 10), 'red'), ((250, 150, 20), 'orange'),
+            ((120, 60, 20), 'brown'), ((240, 230, 30), 'yellow'),
+            ((30, 160, 40), 'green'), ((20, 40, 220), 'blue'),
+            ((130, 30, 200), 'purple'), ((240, 100, 180), 'pink'),
+            ((10, 10, 12), 'black'), ((128, 128, 128), 'grey'),
+            ((250, 250, 250), 'white'),
+        ]:
+            self.assertEqual(colour_name(rgb), name)
+
+    def test_palette_made_when_photo_saved(self):
+        image = Image.objects.create(
+            category=self.category, photo=make_solid_photo('blue')
+        )
+        image.refresh_from_db()
+        self.assertEqual(image.colour, 'blue')
+        self.assertRegexpMatches(
+            image.palette, r'^#[0-9a-f]{6}(,#[0-9a-f]{6})*$'
+        )
+
+    def test_filter_by_colour(self):
+        red = Image.objects.create(
+            category=self.category, photo=make_solid_photo('red')
+        )
+        green = Image.objects.create(
+            category=self.category, photo=make_solid_photo('green')
+        )
+        resp = self.client.get(
+            reverse('gallery:category', args=[self.category.slug]),
+            {'colour': 'red'}
+        )
+        self.assertEqual(list(resp.context['images']), [red])
+
+        # across every album, on the search page
+        resp = self.client.get(reverse('gallery:search'), {'colour': 'green'})
+        self.assertEqual(list(resp.context['images']), [green])
+
+        # unknown colours are ignored
+        resp = self.client.get(
+            reverse('gallery:category', args=[self.category.slug]),
+            {'colour': 'plaid'}
+        )
+        self.assertEqual(list(resp.context['images']), [red, green])
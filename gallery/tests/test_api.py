@@ -0,0 +1,114 @@
+from model_mommy import mommy
+
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from gallery.models import Category, Image
+from gallery.tests.helpers import make_solid_photo, set_up_fb, \
+    use_temp_media_root
+
+
+@override_settings(
+    GALLERY_CACHE_PAGES=True,
+    GALLERY_API_MAX_AGE=30,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'gallery': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'gallery-api-tests',
+        },
+    }
+)
+class ApiTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        caches['gallery'].clear()
+        self.category = mommy.make(
+            Category, name='Api album', description='An album'
+        )
+        self.images = [
+            Image.objects.create(
+                category=self.category, photo=make_solid_photo(colour),
+                caption=colour
+            )
+            for colour in ('red', 'green', 'blue')
+        ]
+        self.album_url = reverse(
+            'gallery:api_album', args=[self.category.slug]
+        )
+
+    def test_album_list(self):
+        resp = self.client.get(reverse('gallery:api_albums'))
+        self.assertEqual(resp.status_code, 200)
+        album = resp.json()['albums'][0]
+        self.assertEqual(album['name'], 'Api album')
+        self.assertEqual(album['image_count'], 3)
+        self.assertTrue(album['url'].endswith(self.album_url))
+        self.assertIn('public', resp['Cache-Control'])
+        self.assertIn('max-age=30', resp['Cache-Control'])
+
+    def test_album_detail_pages(self):
+        with override_settings(GALLERY_PAGE_SIZE=2):
+            resp = self.client.get(self.album_url)
+            data = resp.json()
+            self.assertEqual(data['album']['slug'], self.category.slug)
+            self.assertEqual(
+                [image['id'] for image in data['images']],
+                [image.id for image in self.images[:2]]
+            )
+            self.assertIn('thumbnail', data['images'][0]['renditions'])
+
+            resp = self.client.get(data['next'])
+            data = resp.json()
+            self.assertEqual(
+                [image['id'] for image in data['images']],
+                [self.images[2].id]
+            )
+            self.assertIsNone(data['next'])
+
+    def test_sparse_fieldsets(self):
+        resp = self.client.get(
+            self.album_url,
+            {'fields[album]': 'name', 'fields[image]': 'id,caption,nonsense'}
+        )
+        data = resp.json()
+        self.assertEqual(data['album'], {'name': 'Api album'})
+        self.assertEqual(
+            data['images'][0],
+            {'id': self.images[0].id, 'caption': 'red'}
+        )
+
+    def test_image_detail(self):
+        url = reverse('gallery:api_image', args=[self.images[1].id])
+        image = self.client.get(url).json()['image']
+        self.assertEqual(image['album'], self.category.id)
+        self.assertEqual(image['caption'], 'green')
+
+        resp = self.client.get(reverse('gallery:api_image', args=[0]))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_etags(self):
+        resp = self.client.get(self.album_url)
+        etag = resp['ETag']
+
+        # served without touching the database
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.album_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        # a change to the album changes its etag
+        self.images[0].caption = 'changed'
+        self.images[0].save()
+        resp = self.client.get(self.album_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(resp.json()['images'][0]['caption'], 'changed')
+
+    def test_read_only(self):
+        resp = self.client.post(reverse('gallery:api_albums'))
+        self.assertEqual(resp.status_code, 405)
@@ -0,0 +1,71 @@
+from model_mommy import mommy
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+
+from gallery.models import Category, Image
+from gallery.tests.helpers import set_up_fb
+
+
+@override_settings(MEDIA_ROOT='/tmp/')
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.category = mommy.make(Category, name='conditional')
+        mommy.make(Image, category=self.category)
+        self.url = reverse('gallery:category', args=[self.category.slug])
+
+    def test_unchanged_album_is_not_modified(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp['ETag']
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b'')
+
+    def test_album_etag_changes_with_images(self):
+        etag = self.client.get(self.url)['ETag']
+        image = mommy.make(Image, category=self.category)
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+        etag = resp['ETag']
+        image.delete()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_album_etag_changes_with_page(self):
+        etag = self.client.get(self.url)['ETag']
+        resp = self.client.get(
+            self.url, {'after': '1-1'}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_album_last_modified(self):
+        resp = self.client.get(self.url)
+        last_modified = resp['Last-Modified']
+        self.category.refresh_from_db()
+        self.assertEqual(
+            last_modified,
+            http_date(max(
+                self.category.updated_at, self.category.images_updated_at
+            ).timestamp())
+        )
+        resp = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(resp.status_code, 304)
+
+    def test_menu_and_alternative_view_etags(self):
+        for url in [reverse('gallery:gallery'), reverse('gallery:alternative')]:
+            etag = self.client.get(url)['ETag']
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 304)
+
+            mommy.make(Category, name='new album {}'.format(url))
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 200)
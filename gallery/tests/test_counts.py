@@ -0,0 +1,93 @@
+from model_mommy import mommy
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from gallery.models import Category, Image
+from gallery.tests.helpers import set_up_fb
+
+
+@override_settings(MEDIA_ROOT='/tmp/')
+class CategoryImageCountTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.category = mommy.make(Category, name='counts')
+        self.other_category = mommy.make(Category, name='other')
+
+    def test_count_updated_on_create_and_delete(self):
+        self.assertEqual(self.category.image_count, 0)
+        self.assertIsNone(self.category.images_updated_at)
+
+        image = mommy.make(Image, category=self.category)
+        mommy.make(Image, category=self.category)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.image_count, 2)
+        self.assertIsNotNone(self.category.images_updated_at)
+
+        image.delete()
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.image_count, 1)
+
+    def test_count_updated_on_change_of_category(self):
+        image = mommy.make(Image, category=self.category)
+        image.category = self.other_category
+        image.save()
+
+        self.category.refresh_from_db()
+        self.other_category.refresh_from_db()
+        self.assertEqual(self.category.image_count, 0)
+        self.assertEqual(self.other_category.image_count, 1)
+
+    def test_caption_edit_updates_timestamp_only(self):
+        image = mommy.make(Image, category=self.category)
+        self.category.refresh_from_db()
+        updated = self.category.images_updated_at
+
+        image.caption = 'new caption'
+        with CaptureQueriesContext(connection) as queries:
+            image.save()
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.image_count, 1)
+        self.assertGreater(self.category.images_updated_at, updated)
+        self.assertFalse(
+            [query for query in queries.captured_queries
+             if 'image_count' in query['sql']]
+        )
+
+    def test_deleting_category_skips_count_updates(self):
+        mommy.make(Image, category=self.category, _quantity=5)
+        with CaptureQueriesContext(connection) as queries:
+            self.category.delete()
+        self.assertFalse(Image.objects.exists())
+        self.assertFalse(
+            [query for query in queries.captured_queries
+             if query['sql'].startswith('UPDATE "gallery_category"')]
+        )
+
+        # a later delete of a lone image still updates its album's count
+        mommy.make(Image, category=self.other_category).delete()
+        self.other_category.refresh_from_db()
+        self.assertEqual(self.other_category.image_count, 0)
+
+    def test_reconcile_gallery_counts(self):
+        mommy.make(Image, category=self.category, _quantity=3)
+        Category.objects.filter(id=self.category.id).update(image_count=10)
+        Category.objects.filter(id=self.other_category.id).update(
+            image_count=2
+        )
+
+        out = StringIO()
+        call_command('reconcile_gallery_counts', '--dry-run', stdout=out)
+        self.assertIn('2 album count(s) to correct', out.getvalue())
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.image_count, 10)
+
+        call_command('reconcile_gallery_counts', stdout=out)
+        self.category.refresh_from_db()
+        self.other_category.refresh_from_db()
+        self.assertEqual(self.category.image_count, 3)
+        self.assertEqual(self.other_category.image_count, 0)
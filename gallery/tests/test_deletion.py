@@ -0,0 +1,115 @@
+import os
+
+from mock import Mock, patch
+from model_mommy import mommy
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from gallery.models import Category, FileDeletionFailure, Image
+from gallery.tests.helpers import make_solid_photo, set_up_fb, \
+    use_temp_media_root
+
+
+class FileDeletionTests(TransactionTestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='deletion')
+
+    def _make_image(self, colour):
+        return Image.objects.create(
+            category=self.category, photo=make_solid_photo(colour)
+        )
+
+    def test_files_deleted_after_commit(self):
+        paths = [
+            self._make_image(colour).photo.path
+            for colour in ('red', 'green', 'blue')
+        ]
+        with transaction.atomic():
+            self.category.delete()
+            self.assertTrue(all(os.path.exists(path) for path in paths))
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_files_kept_on_rollback(self):
+        path = self._make_image('red').photo.path
+        try:
+            with transaction.atomic():
+                self.category.delete()
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertTrue(Image.objects.exists())
+        self.assertTrue(os.path.exists(path))
+
+        # a later delete in a new transaction still deletes the file
+        Image.objects.get().delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_savepoint_rollback_keeps_files(self):
+        kept, deleted = self._make_image('red'), self._make_image('green')
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    kept.delete()
+                    raise ValueError
+            except ValueError:
+                pass
+            deleted.delete()
+        self.assertTrue(os.path.exists(kept.photo.path))
+        self.assertFalse(os.path.exists(deleted.photo.path))
+
+    def test_references_checked_in_chunks(self):
+        paths = [
+            self._make_image(colour).photo.path
+            for colour in ('red', 'green', 'blue')
+        ]
+        with patch('gallery.deletion.CHUNK_SIZE', 2), \
+                CaptureQueriesContext(connection) as queries:
+            self.category.delete()
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        # photos and their renditions share their keys, so are checked
+        # together, two at a time
+        photo_queries = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT "gallery_image"."photo"')
+        ]
+        self.assertEqual(len(photo_queries), 2)
+
+    def test_renditions_and_raw_photo_deleted(self):
+        image = self._make_image('red')
+        image.raw_photo.save(
+            'raw.jpg', make_solid_photo('blue'), save=False
+        )
+        image.save()
+        image.thumbnail.generate()
+        paths = [
+            image.photo.path, image.raw_photo.path,
+            os.path.join(self.media_root, image.thumbnail.name)
+        ]
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        image.delete()
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_failed_deletion_recorded_and_retried(self):
+        path = self._make_image('red').photo.path
+        storage = Mock()
+        storage.delete.side_effect = OSError('permission denied')
+        with patch('gallery.deletion.get_storage', return_value=storage):
+            Image.objects.get().delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(
+            FileDeletionFailure.objects.filter(kind='photo').exists()
+        )
+
+        out = StringIO()
+        call_command('retry_gallery_file_deletions', stdout=out)
+        self.assertIn('0 still failing', out.getvalue())
+        self.assertFalse(FileDeletionFailure.objects.exists())
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,209 @@
+import random
+
+from io import BytesIO
+
+from model_mommy import mommy
+from PIL import Image as PILImage
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from gallery.duplicates import BKTree, find_duplicate_groups, \
+    find_duplicates_of, get_index, hamming_distance, similar_image_ids
+from gallery.models import Category, Image
+from gallery.processing import process_pending_images
+from gallery.tests.helpers import TEST_JPG, set_up_fb, use_temp_media_root
+from gallery.tests.test_importer import make_zip
+
+
+def make_gradient_photo(size=(90, 60), reverse=False, name='gradient.jpg'):
+    image = PILImage.new('L', size)
+    image.putdata([
+        (size[0] - x if reverse else x) * 255 // size[0]
+        for y in range(size[1]) for x in range(size[0])
+    ])
+    output = BytesIO()
+    image.convert('RGB').save(output, format='JPEG')
+    return ContentFile(output.getvalue(), name=name)
+
+
+class BKTreeTests(TestCase):
+
+    def test_search_matches_pairwise_scan(self):
+        rng = random.Random(1)
+        values = [rng.getrandbits(64) for _ in range(500)]
+        tree = BKTree()
+        for item, value in enumerate(values):
+            tree.add(value, item)
+        self.assertEqual(tree.size, 500)
+
+        for target in values[:20] + [rng.getrandbits(64)]:
+            expected = sorted(
+                (hamming_distance(target, value), item)
+                for item, value in enumerate(values)
+                if hamming_distance(target, value) <= 24
+            )
+            self.assertEqual(sorted(tree.search(target, 24)), expected)
+
+
+@override_settings(GALLERY_DUPLICATE_DISTANCE=6)
+class DuplicateTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='originals')
+        self.other_category = mommy.make(Category, name='copies')
+        self.original = Image.objects.create(
+            category=self.category, photo=make_gradient_photo()
+        )
+        # a smaller copy of the same photo
+        self.copy = Image.objects.create(
+            category=self.other_category,
+            photo=make_gradient_photo(size=(45, 30))
+        )
+        self.different = Image.objects.create(
+            category=self.category, photo=make_gradient_photo(reverse=True)
+        )
+
+    def test_photos_are_hashed(self):
+        for image in Image.objects.all():
+            self.assertEqual(len(image.phash), 16)
+        self.assertLessEqual(
+            hamming_distance(
+                int(self.original.phash, 16), int(self.copy.phash, 16)
+            ),
+            6
+        )
+
+    def test_find_duplicates(self):
+        self.assertEqual(
+            find_duplicates_of([self.original, self.different]),
+            {self.original: [self.copy]}
+        )
+        self.assertEqual(
+            find_duplicate_groups(), [{self.original.id, self.copy.id}]
+        )
+
+    def test_report(self):
+        out = StringIO()
+        call_command('gallery_duplicates_report', stdout=out)
+        output = out.getvalue()
+        self.assertIn(
+            'image {} in "originals"'.format(self.original.id), output
+        )
+        self.assertIn('image {} in "copies"'.format(self.copy.id), output)
+        self.assertIn('1 group(s) of near-duplicates, 2 image(s)', output)
+
+    @override_settings(GALLERY_DEFER_PROCESSING=True)
+    def test_album_page_flags_processed_duplicates(self):
+        User.objects.create_user(
+            username='test', password='test', is_staff=True
+        )
+        self.client.login(username='test', password='test')
+        album = mommy.make(Category, name='uploads')
+        url = reverse('gallery:edit_category', args=[album.id])
+        self.client.post(url, {
+            'name': album.name,
+            'description': '',
+            'images-TOTAL_FORMS': 1,
+            'images-INITIAL_FORMS': 0,
+            'images-0-photo': SimpleUploadedFile(
+                'again.jpg', make_gradient_photo().read()
+            ),
+        })
+        # not hashed until it's processed
+        resp = self.client.get(url)
+        self.assertNotIn('Possible duplicate', resp.rendered_content)
+
+        process_pending_images()
+        resp = self.client.get(url)
+        self.assertIn('Possible duplicate', resp.rendered_content)
+        self.assertIn('in "originals"', resp.rendered_content)
+        self.assertIn('in "copies"', resp.rendered_content)
+
+    @override_settings(GALLERY_DEFER_PROCESSING=False)
+    def test_import_warns_of_duplicates(self):
+        with open(TEST_JPG, 'rb') as file:
+            Image.objects.create(
+                category=self.other_category,
+                photo=ContentFile(file.read(), name='existing.jpg')
+            )
+        User.objects.create_user(
+            username='test', password='test', is_staff=True
+        )
+        self.client.login(username='test', password='test')
+        resp = self.client.post(
+            reverse('gallery:import_images', args=[self.category.id]),
+            {'archive': SimpleUploadedFile('shoot.zip', make_zip().read())},
+            follow=True
+        )
+        self.assertIn('looks like a duplicate of', resp.rendered_content)
+        self.assertIn('in &quot;copies&quot;', resp.rendered_content)
+
+
+@override_settings(
+    GALLERY_DUPLICATE_DISTANCE=6,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'gallery': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'gallery-tests',
+        },
+    }
+)
+class DuplicateIndexTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        caches['gallery'].clear()
+        self.category = mommy.make(Category, name='originals')
+        self.original = Image.objects.create(
+            category=self.category, photo=make_gradient_photo()
+        )
+        self.different = Image.objects.create(
+            category=self.category, photo=make_gradient_photo(reverse=True)
+        )
+
+    def test_new_images_added_to_index(self):
+        index = get_index()
+        self.assertEqual(index.size, 2)
+        copy = Image.objects.create(
+            category=self.category, photo=make_gradient_photo(size=(45, 30))
+        )
+        # just the query for images hashed since
+        with self.assertNumQueries(1):
+            self.assertIs(get_index(), index)
+        self.assertEqual(index.size, 3)
+        self.assertIn(
+            copy.id,
+            [image_id for _, image_id
+             in similar_image_ids(self.original.phash)]
+        )
+
+    def test_index_rebuilt_when_images_deleted(self):
+        index = get_index()
+        self.different.delete()
+        rebuilt = get_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.size, 1)
+
+    def test_index_rebuilt_when_photo_rehashed(self):
+        index = get_index()
+        self.different.photo = make_gradient_photo(size=(45, 30))
+        self.different.save()
+        rebuilt = get_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(
+            find_duplicates_of([self.original]),
+            {self.original: [self.different]}
+        )
@@ -0,0 +1,138 @@
+import os
+import shutil
+import zipfile
+
+from io import BytesIO
+from tempfile import mkdtemp
+
+from mock import patch
+from model_mommy import mommy
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from gallery.importer import import_images, queue_images
+from gallery.models import Category, Image
+from gallery.tests.helpers import TEST_JPG, set_up_fb, use_temp_media_root
+
+
+def make_zip():
+    output = BytesIO()
+    with zipfile.ZipFile(output, 'w') as archive:
+        archive.write(TEST_JPG, 'shoot/one.jpg')
+        archive.write(TEST_JPG, 'shoot/two.JPG')
+        archive.writestr('shoot/broken.jpg', b'not an image')
+        archive.writestr('shoot/notes.txt', b'not a photo')
+        archive.writestr('__MACOSX/shoot/._one.jpg', b'resource fork')
+    output.seek(0)
+    return output
+
+
+class ImportImagesTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='import')
+
+    def test_import_zip(self):
+        stats = import_images(self.category, make_zip(), processes=2)
+        self.assertEqual(stats.imported, 2)
+        self.assertEqual(stats.failed, ['broken.jpg'])
+        self.assertIn('2 image(s) imported, 1 failed', str(stats))
+
+        images = Image.objects.filter(category=self.category)
+        self.assertEqual(images.count(), 2)
+        # every file read, against the photos stored; whether re-encoding
+        # saves anything depends on the input and Pillow's encoder
+        self.assertEqual(
+            stats.bytes_in,
+            2 * os.path.getsize(TEST_JPG) + len(b'not an image')
+        )
+        self.assertEqual(
+            stats.bytes_out,
+            sum(os.path.getsize(image.photo.path) for image in images)
+        )
+        self.assertEqual(stats.bytes_saved, stats.bytes_in - stats.bytes_out)
+        for image in images:
+            self.assertTrue(image.is_ready)
+            self.assertTrue(image.photo.name.endswith('.jpg'))
+            self.assertTrue(os.path.exists(image.photo.path))
+            # generated by the import, not the first page showing it
+            self.assertTrue(os.path.exists(image.thumbnail.path))
+
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.image_count, 2)
+
+    def test_decoder_errors_are_failures(self):
+        # e.g. what Pillow raises for some broken PNGs
+        with patch(
+                'gallery.importer.analyse', side_effect=SyntaxError('broken')
+        ):
+            stats = import_images(self.category, make_zip(), processes=1)
+        self.assertEqual(stats.imported, 0)
+        self.assertEqual(len(stats.failed), 3)
+        self.assertFalse(Image.objects.exists())
+
+    def test_import_directory_command(self):
+        directory = mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shutil.copy(TEST_JPG, os.path.join(directory, 'one.jpg'))
+        out = StringIO()
+        call_command(
+            'import_gallery_images', 'new album', directory, '--create',
+            '--processes', '1', stdout=out
+        )
+        self.assertIn('1 image(s) imported', out.getvalue())
+        self.assertEqual(
+            Category.objects.get(name='new album').images.count(), 1
+        )
+
+    def test_queue_images(self):
+        stats = queue_images(self.category, make_zip())
+        self.assertEqual(stats.imported, 3)
+        self.assertEqual(
+            Image.objects.filter(status=Image.PENDING).count(), 3
+        )
+
+    @override_settings(GALLERY_DEFER_PROCESSING=True)
+    def test_import_view(self):
+        User.objects.create_user(
+            username='test', email='staff@test.com', password='test',
+            is_staff=True
+        )
+        self.client.login(username='test', password='test')
+        url = reverse('gallery:import_images', args=[self.category.id])
+        archive = SimpleUploadedFile('shoot.zip', make_zip().read())
+        resp = self.client.post(url, {'archive': archive})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(self.category.images.count(), 3)
+
+        # not a zip file
+        resp = self.client.post(
+            url,
+            {'archive': SimpleUploadedFile('shoot.zip', b'not a zip')},
+            follow=True
+        )
+        self.assertIn('Zip files only', resp.rendered_content)
+        self.assertEqual(self.category.images.count(), 3)
+
+    @override_settings(GALLERY_DEFER_PROCESSING=False)
+    def test_import_view_encodes_without_a_pool(self):
+        User.objects.create_user(
+            username='test', email='staff@test.com', password='test',
+            is_staff=True
+        )
+        self.client.login(username='test', password='test')
+        url = reverse('gallery:import_images', args=[self.category.id])
+        archive = SimpleUploadedFile('shoot.zip', make_zip().read())
+        with patch('gallery.importer.multiprocessing.Pool') as pool:
+            self.client.post(url, {'archive': archive})
+        self.assertFalse(pool.called)
+        self.assertEqual(
+            self.category.images.filter(status=Image.READY).count(), 2
+        )
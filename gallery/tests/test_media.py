@@ -0,0 +1,96 @@
+import os
+import shutil
+
+from tempfile import mkdtemp
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+
+from gallery.tests.helpers import set_up_fb
+
+
+CONTENT = b'0123456789' * 10
+
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        for directory in ['gallery/uploads', 'gallery/ab']:
+            os.makedirs(os.path.join(self.media_root, directory))
+        self.photo = os.path.join(self.media_root, 'gallery/ab/photo.jpg')
+        with open(self.photo, 'wb') as file:
+            file.write(CONTENT)
+        with open(
+            os.path.join(self.media_root, 'gallery/uploads/raw.jpg'), 'wb'
+        ) as file:
+            file.write(CONTENT)
+
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, MEDIA_OFFLOAD=None
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_streams_file(self):
+        resp = self.client.get('/media/gallery/ab/photo.jpg')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), CONTENT)
+        self.assertEqual(resp['Content-Type'], 'image/jpeg')
+        self.assertEqual(resp['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(resp['Accept-Ranges'], 'bytes')
+
+    def test_not_modified(self):
+        resp = self.client.get(
+            '/media/gallery/ab/photo.jpg',
+            HTTP_IF_MODIFIED_SINCE=http_date(os.stat(self.photo).st_mtime)
+        )
+        self.assertEqual(resp.status_code, 304)
+
+    def test_byte_ranges(self):
+        resp = self.client.get(
+            '/media/gallery/ab/photo.jpg', HTTP_RANGE='bytes=10-19'
+        )
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b''.join(resp.streaming_content), CONTENT[10:20])
+        self.assertEqual(resp['Content-Range'], 'bytes 10-19/100')
+
+        resp = self.client.get(
+            '/media/gallery/ab/photo.jpg', HTTP_RANGE='bytes=-5'
+        )
+        self.assertEqual(b''.join(resp.streaming_content), CONTENT[-5:])
+
+        resp = self.client.get(
+            '/media/gallery/ab/photo.jpg', HTTP_RANGE='bytes=200-'
+        )
+        self.assertEqual(resp.status_code, 416)
+
+    def test_missing_and_outside_media_root(self):
+        for path in ['gallery/ab/missing.jpg', 'gallery', '../etc/passwd']:
+            resp = self.client.get('/media/' + path)
+            self.assertEqual(resp.status_code, 404)
+
+    def test_uploads_staff_only(self):
+        url = '/media/gallery/uploads/raw.jpg'
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        User.objects.create_user(
+            username='staff', password='test', is_staff=True
+        )
+        self.client.login(username='staff', password='test')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_offload(self):
+        with override_settings(MEDIA_OFFLOAD='x-accel-redirect'):
+            resp = self.client.get('/media/gallery/ab/photo.jpg')
+        self.assertEqual(
+            resp['X-Accel-Redirect'], '/protected-media/gallery/ab/photo.jpg'
+        )
+        self.assertEqual(resp.content, b'')
+
+        with override_settings(MEDIA_OFFLOAD='x-sendfile'):
+            resp = self.client.get('/media/gallery/ab/photo.jpg')
+        self.assertEqual(resp['X-Sendfile'], self.photo)
@@ -0,0 +1,89 @@
+import os
+
+from model_mommy import mommy
+
+from tempfile import NamedTemporaryFile
+
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from gallery.models import Category, Image
+from gallery.tests.helpers import make_photo, set_up_fb, use_temp_media_root
+
+
+class GalleryMenuQueryTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.files = []
+
+    def tearDown(self):
+        for file in self.files:
+            file.close()
+
+    def _make_images(self, category, count):
+        images = []
+        for i in range(count):
+            file = NamedTemporaryFile(suffix='.jpg', dir=self.media_root)
+            self.files.append(file)
+            images.append(
+                mommy.make(Image, category=category, photo=file.name)
+            )
+        return images
+
+    def test_for_menu_query_count_is_constant(self):
+        for i in range(5):
+            category = mommy.make(Category, name='cat{}'.format(i))
+            self._make_images(category, i + 2)
+
+        with self.assertNumQueries(2):
+            categories = list(Category.objects.for_menu())
+            for category in categories:
+                list(category.cover_images)
+                category.image_count
+
+    def test_for_menu_cover_images(self):
+        big = mommy.make(Category, name='b')
+        small = mommy.make(Category, name='a')
+        empty = mommy.make(Category, name='c')
+        big_images = self._make_images(big, 6)
+        small_images = self._make_images(small, 2)
+
+        categories = list(Category.objects.for_menu())
+        self.assertEqual(
+            [category.id for category in categories],
+            [small.id, big.id, empty.id]
+        )
+        self.assertEqual(
+            [(category.image_count, category.cover_images)
+             for category in categories],
+            [(2, small_images), (6, big_images[:4]), (0, [])]
+        )
+
+
+@override_settings(GALLERY_COVER_COLLAGES=True)
+class CategoryCollageTests(TransactionTestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='collage')
+
+    def test_refresh_collage(self):
+        image = Image.objects.create(category=self.category, photo=make_photo())
+        self.category.refresh_collage()
+        self.assertTrue(self.category.collage)
+        self.assertTrue(os.path.exists(self.category.collage.path))
+        collage_name = self.category.collage.name
+
+        # unchanged covers, collage isn't rebuilt
+        self.category.refresh_collage()
+        self.assertEqual(self.category.collage.name, collage_name)
+
+        # no images left, collage is removed
+        image.delete()
+        self.category.refresh_collage()
+        self.assertFalse(self.category.collage)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.media_root, collage_name))
+        )
@@ -0,0 +1,86 @@
+from model_mommy import mommy
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from gallery.models import Category, Image
+from gallery.tests.helpers import set_up_fb
+
+
+@override_settings(
+    MEDIA_ROOT='/tmp/',
+    GALLERY_CACHE_PAGES=True,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'gallery': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'gallery-tests',
+        },
+    }
+)
+class GalleryPageCacheTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        caches['gallery'].clear()
+        self.category = mommy.make(Category, name='cached')
+        mommy.make(Image, category=self.category)
+        self.url = reverse('gallery:category', args=[self.category.slug])
+
+    def test_anonymous_page_served_from_cache(self):
+        resp = self.client.get(self.url)
+        self.assertIsNotNone(resp.context)
+
+        # just the ETag query
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url)
+        self.assertIsNone(cached.context)  # not rendered
+        self.assertEqual(cached.content, resp.content)
+
+        menu_url = reverse('gallery:gallery')
+        self.client.get(menu_url)
+        with self.assertNumQueries(1):
+            self.client.get(menu_url)
+
+    def test_image_changes_invalidate_album_and_menu(self):
+        menu_url = reverse('gallery:gallery')
+        self.client.get(self.url)
+        self.client.get(menu_url)
+
+        mommy.make(Image, category=self.category)
+        resp = self.client.get(self.url)
+        self.assertEqual(len(resp.context['images']), 2)
+        self.assertIsNotNone(self.client.get(menu_url).context)
+
+    def test_other_albums_stay_cached(self):
+        self.client.get(self.url)
+        other = mommy.make(Category, name='other')
+        mommy.make(Image, category=other)
+        self.assertIsNone(self.client.get(self.url).context)
+
+    def test_category_edit_invalidates_album(self):
+        self.client.get(self.url)
+        self.category.description = 'new description'
+        self.category.save()
+        resp = self.client.get(self.url)
+        self.assertIsNotNone(resp.context)
+        self.assertIn('new description', resp.content.decode())
+
+    def test_logged_in_users_bypass_cache(self):
+        self.client.get(self.url)
+        staff_user = User.objects.create_user(
+            username='staff', email='staff@test.com', password='test',
+        )
+        staff_user.is_staff = True
+        staff_user.save()
+        self.client.login(username='staff', password='test')
+        self.assertIsNotNone(self.client.get(self.url).context)
+
+    def test_unknown_album_not_cached(self):
+        url = reverse('gallery:category', args=['unknown'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -0,0 +1,85 @@
+from model_mommy import mommy
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from gallery.models import Category, Image
+from gallery.pagination import InvalidCursor, paginate_images
+from gallery.tests.helpers import set_up_fb
+
+
+@override_settings(MEDIA_ROOT='/tmp/', GALLERY_PAGE_SIZE=2)
+class ImagePaginationTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.category = mommy.make(Category, name='b')
+        self.other_category = mommy.make(Category, name='a')
+        self.images = mommy.make(Image, category=self.category, _quantity=3)
+        self.other_images = mommy.make(
+            Image, category=self.other_category, _quantity=2
+        )
+
+    def test_pages_follow_category_then_id(self):
+        expected = sorted(
+            self.images + self.other_images,
+            key=lambda image: (image.category_id, image.id)
+        )
+        pages = []
+        cursor = None
+        while True:
+            page = paginate_images(Image.objects.all(), cursor)
+            pages.append(page.object_list)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_page_is_a_single_query(self):
+        first = paginate_images(Image.objects.all())
+        with self.assertNumQueries(1):
+            paginate_images(Image.objects.all(), first.next_cursor)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            paginate_images(Image.objects.all(), 'foo')
+
+    def test_album_page_is_paginated(self):
+        url = reverse('gallery:category', args=[self.category.slug])
+        resp = self.client.get(url)
+        self.assertEqual(list(resp.context_data['images']), self.images[:2])
+        self.assertIn('id="load-more-images"', resp.rendered_content)
+
+        resp = self.client.get(url, {'after': resp.context_data['next_cursor']})
+        self.assertEqual(list(resp.context_data['images']), self.images[2:])
+        self.assertIsNone(resp.context_data['next_cursor'])
+        self.assertNotIn('id="load-more-images"', resp.rendered_content)
+
+        resp = self.client.get(url, {'after': 'foo'})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_image_page_json(self):
+        url = reverse('gallery:image_page')
+        resp = self.client.get(url, {'category': self.category.id})
+        data = resp.json()
+        self.assertEqual(
+            [image['id'] for image in data['images']],
+            [image.id for image in self.images[:2]]
+        )
+        self.assertEqual(
+            sorted(data['images'][0].keys()),
+            ['caption', 'category', 'height', 'id', 'large', 'medium',
+             'placeholder', 'sources', 'srcset', 'thumbnail',
+             'variant_srcsets', 'width']
+        )
+
+        resp = self.client.get(
+            url, {'category': self.category.id, 'after': data['next_cursor']}
+        )
+        data = resp.json()
+        self.assertEqual(
+            [image['id'] for image in data['images']], [self.images[2].id]
+        )
+        self.assertIsNone(data['next_cursor'])
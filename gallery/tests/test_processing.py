@@ -0,0 +1,128 @@
+import os
+
+from mock import patch
+from model_mommy import mommy
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from gallery.models import Category, Image
+from gallery.processing import claim_next_image, process_image, \
+    process_pending_images
+from gallery.tests.helpers import make_photo, set_up_fb, use_temp_media_root
+
+
+@override_settings(GALLERY_DEFER_PROCESSING=True)
+class DeferredProcessingTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='deferred')
+        self.staff_user = User.objects.create_user(
+            username='test', email='staff@test.com', password='test',
+            is_staff=True
+        )
+        self.client.login(username='test', password='test')
+
+    def _upload(self):
+        return self.client.post(
+            reverse('gallery:edit_category', args=[self.category.id]),
+            {
+                'name': self.category.name,
+                'description': '',
+                'images-TOTAL_FORMS': 1,
+                'images-INITIAL_FORMS': 0,
+                'images-0-photo': make_photo(),
+            }
+        )
+
+    def test_upload_is_stored_raw(self):
+        self._upload()
+        image = Image.objects.get()
+        self.assertEqual(image.status, Image.PENDING)
+        self.assertFalse(image.photo)
+        self.assertTrue(os.path.exists(image.raw_photo.path))
+        self.assertEqual(image.filename, 'testjpg.jpg')
+
+    def test_process_pending_images(self):
+        self._upload()
+        image = Image.objects.get()
+        raw_path = image.raw_photo.path
+
+        self.assertEqual(process_pending_images(), 1)
+        image.refresh_from_db()
+        self.assertEqual(image.status, Image.READY)
+        self.assertTrue(image.photo)
+        self.assertFalse(image.raw_photo)
+        self.assertFalse(os.path.exists(raw_path))
+        self.assertTrue(os.path.exists(image.thumbnail.path))
+
+        # nothing left to do
+        self.assertIsNone(claim_next_image())
+
+    def test_unreadable_upload_is_marked_failed(self):
+        image = mommy.make(
+            Image, category=self.category, status=Image.PENDING,
+            raw_photo='gallery/uploads/missing.jpg'
+        )
+        process_pending_images()
+        image.refresh_from_db()
+        self.assertEqual(image.status, Image.FAILED)
+
+    def test_decode_errors_dont_stop_processing(self):
+        self._upload()
+        self._upload()
+        first, second = Image.objects.order_by('id')
+        with patch(
+                'gallery.processing.File',
+                side_effect=[SyntaxError('broken'), File(make_photo())]
+        ):
+            self.assertEqual(process_pending_images(), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, Image.FAILED)
+        self.assertEqual(second.status, Image.READY)
+
+    def test_edits_made_during_processing_are_kept(self):
+        self._upload()
+        image = claim_next_image()
+        Image.objects.filter(id=image.id).update(caption='edited')
+        self.assertTrue(process_image(image))
+        image.refresh_from_db()
+        self.assertEqual(image.caption, 'edited')
+        self.assertEqual(image.status, Image.READY)
+
+    def test_image_deleted_during_processing_isnt_saved(self):
+        self._upload()
+        image = claim_next_image()
+        Image.objects.filter(id=image.id).delete()
+        self.assertFalse(process_image(image))
+        self.assertFalse(Image.objects.exists())
+
+    def test_renditions_generated_once(self):
+        self._upload()
+        with patch.object(
+                Image, 'generate_renditions', autospec=True
+        ) as generate:
+            process_pending_images()
+        self.assertEqual(generate.call_count, 1)
+
+    def test_process_gallery_images_command(self):
+        self._upload()
+        out = StringIO()
+        call_command('process_gallery_images', stdout=out)
+        self.assertIn('1 image(s) processed', out.getvalue())
+        self.assertTrue(Image.objects.get().is_ready)
+
+    @override_settings(GALLERY_DEFER_PROCESSING=False)
+    def test_upload_processed_in_request_if_not_deferred(self):
+        self._upload()
+        image = Image.objects.get()
+        self.assertEqual(image.status, Image.READY)
+        self.assertTrue(image.photo)
+        self.assertFalse(image.raw_photo)
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+
+from tempfile import mkdtemp
+
+from model_mommy import mommy
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from gallery.models import Category, Image
+from gallery.tests.helpers import make_solid_photo, set_up_fb, \
+    use_temp_media_root
+
+
+class RegenerateRenditionsTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='regenerate')
+        self.other_category = mommy.make(Category, name='other')
+        self.images = [
+            Image.objects.create(
+                category=self.category, photo=make_solid_photo(colour)
+            )
+            for colour in ('red', 'green', 'blue')
+        ]
+        self.other_image = Image.objects.create(
+            category=self.other_category, photo=make_solid_photo('yellow')
+        )
+        tempdir = mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.checkpoint = os.path.join(tempdir, 'checkpoint.json')
+
+    def _regenerate(self, *args):
+        out = StringIO()
+        call_command(
+            'regenerate_gallery_renditions', '--processes', '2',
+            '--checkpoint', self.checkpoint, *args, stdout=out, stderr=out
+        )
+        return out.getvalue()
+
+    def test_regenerates_renditions(self):
+        for image in self.images:
+            if os.path.exists(image.thumbnail.path):
+                os.remove(image.thumbnail.path)
+
+        output = self._regenerate('--category', self.category.slug)
+        self.assertIn('3 image(s) regenerated, 0 failed', output)
+        for image in self.images:
+            self.assertTrue(os.path.exists(image.thumbnail.path))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_missing_only(self):
+        image = self.images[0]
+        os.remove(image.thumbnail.path)
+        cache.clear()  # imagekit's record that the file exists
+        generated = os.path.getmtime(image.medium.path)
+
+        output = self._regenerate('--missing')
+        self.assertIn('4 image(s) regenerated, 0 failed', output)
+        self.assertTrue(os.path.exists(image.thumbnail.path))
+        # renditions that exist are left alone
+        self.assertEqual(os.path.getmtime(image.medium.path), generated)
+
+    def test_id_range(self):
+        output = self._regenerate(
+            '--from-id', str(self.images[1].id),
+            '--to-id', str(self.images[2].id)
+        )
+        self.assertIn('2 image(s) regenerated', output)
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as file:
+            json.dump(
+                {
+                    'filters': {
+                        'category_ids': [self.category.id],
+                        'from_id': None, 'to_id': None
+                    },
+                    'last_id': self.images[0].id
+                },
+                file
+            )
+        output = self._regenerate('--category', str(self.category.id))
+        self.assertIn('Resuming after image {}'.format(self.images[0].id), output)
+        self.assertIn('2 image(s) regenerated', output)
+
+        # a checkpoint for other options is ignored
+        with open(self.checkpoint, 'w') as file:
+            json.dump(
+                {'filters': {}, 'last_id': self.other_image.id}, file
+            )
+        output = self._regenerate()
+        self.assertIn('Ignoring checkpoint', output)
+        self.assertIn('4 image(s) regenerated', output)
+
+    def test_reports_failures(self):
+        Image.objects.filter(id=self.images[0].id).update(photo='missing.jpg')
+        output = self._regenerate('--category', self.category.slug)
+        self.assertIn(
+            'Image {}: failed'.format(self.images[0].id), output
+        )
+        self.assertIn('2 image(s) regenerated, 1 failed', output)
@@ -0,0 +1,190 @@
+import os
+
+from mock import patch
+from model_mommy import mommy
+
+from tempfile import NamedTemporaryFile
+
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from imagekit.cachefiles import ImageCacheFile
+
+from PIL import Image as PILImage
+
+from gallery.imagegenerators import RENDITIONS, VARIANT_FORMATS
+from gallery.models import Category, Image
+from gallery.tests.helpers import make_photo, make_solid_photo, set_up_fb, \
+    use_temp_media_root
+
+
+def url_of(srcset):
+    """
+    The url of the first candidate in a srcset
+    """
+    return srcset.split(' ', 1)[0]
+
+
+class RenditionTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='renditions')
+
+    def test_renditions_are_resized_copies(self):
+        image = Image.objects.create(category=self.category, photo=make_photo())
+        for name, width in [('thumbnail', 320), ('medium', 800)]:
+            url = image.rendition_url(name)
+            self.assertNotEqual(url, image.photo.url)
+            rendition = getattr(image, name)
+            size = PILImage.open(rendition.path).size
+            self.assertLessEqual(max(size), width)
+
+    def test_renditions_generated_when_photo_saved(self):
+        image = Image.objects.create(category=self.category, photo=make_photo())
+        for name, _ in RENDITIONS:
+            self.assertTrue(os.path.exists(image.rendition_file(name).path))
+            for format, _, _ in VARIANT_FORMATS:
+                self.assertTrue(
+                    os.path.exists(image.rendition_file(name, format).path)
+                )
+
+    def test_save_survives_rendition_errors(self):
+        cache.clear()  # imagekit's record of earlier tests' renditions
+        with patch.object(
+                ImageCacheFile, 'generate', side_effect=SyntaxError('bad')
+        ):
+            image = Image.objects.create(
+                category=self.category, photo=make_photo()
+            )
+        self.assertTrue(Image.objects.filter(id=image.id).exists())
+        self.assertEqual(image.rendition_url('thumbnail'), image.photo.url)
+
+    def test_pages_dont_generate_renditions(self):
+        image = Image.objects.create(category=self.category, photo=make_photo())
+        os.remove(image.thumbnail.path)
+        cache.clear()  # imagekit's record that the file exists
+
+        with patch.object(ImageCacheFile, '_generate') as generate:
+            resp = self.client.get(
+                reverse('gallery:category', args=[self.category.slug])
+            )
+        self.assertFalse(generate.called)
+        # the missing thumbnail falls back to the photo
+        self.assertIn(
+            'src="{}"'.format(image.photo.url), resp.rendered_content
+        )
+
+    def test_rendition_urls_looked_up_once(self):
+        image = Image.objects.create(
+            category=self.category, photo=make_solid_photo('red', (1000, 500))
+        )
+        image.refresh_from_db()
+        with patch.object(
+                ImageCacheFile, '__bool__', return_value=True
+        ) as exists:
+            srcset = image.rendition_srcset()
+            self.assertEqual(image.rendition_srcset(), srcset)
+            self.assertIn(image.rendition_url('thumbnail'), srcset)
+        self.assertEqual(exists.call_count, len(RENDITIONS))
+
+    def test_rendition_falls_back_to_photo_for_unreadable_file(self):
+        file = NamedTemporaryFile(suffix='.jpg', dir=self.media_root)
+        image = mommy.make(Image, photo=file.name, category=self.category)
+        self.assertEqual(image.rendition_url('thumbnail'), image.photo.url)
+
+    def test_srcset(self):
+        image = Image.objects.create(
+            category=self.category, photo=make_solid_photo('red', (1000, 500))
+        )
+        image.refresh_from_db()
+        self.assertEqual(
+            image.rendition_srcset(),
+            '{} 320w, {} 800w, {} 1000w'.format(
+                image.rendition_url('thumbnail'),
+                image.rendition_url('medium'),
+                image.rendition_url('large')
+            )
+        )
+
+        resp = self.client.get(
+            reverse('gallery:category', args=[self.category.slug])
+        )
+        # the thumbnail is shown 150px high, so 300px wide
+        self.assertIn(
+            'srcset="{}" sizes="300px" width="320" height="160" '
+            'loading="lazy" decoding="async"'.format(image.rendition_srcset()),
+            resp.rendered_content
+        )
+        # for the modal viewer to pick from, and prefetch
+        self.assertIn(
+            'data-srcset="{}"'.format(image.rendition_srcset()),
+            resp.rendered_content
+        )
+
+    def test_srcset_of_small_photo(self):
+        # renditions aren't upscaled, so are all the same as the thumbnail
+        image = Image.objects.create(
+            category=self.category, photo=make_solid_photo('red', (200, 100))
+        )
+        image.refresh_from_db()
+        self.assertEqual(
+            image.rendition_srcset(),
+            '{} 200w'.format(image.rendition_url('thumbnail'))
+        )
+
+    def test_unknown_rendition(self):
+        image = mommy.make(Image, category=self.category)
+        with self.assertRaises(ValueError):
+            image.rendition_url('huge')
+
+    def test_album_page_uses_renditions(self):
+        image = Image.objects.create(category=self.category, photo=make_photo())
+        resp = self.client.get(
+            reverse('gallery:category', args=[self.category.slug])
+        )
+        content = resp.rendered_content
+        self.assertIn(
+            'src="{}"'.format(image.rendition_url('thumbnail')), content
+        )
+        self.assertIn(
+            'data-image="{}"'.format(image.rendition_url('large')), content
+        )
+        self.assertNotIn('src="{}"'.format(image.photo.url), content)
+
+    @skipUnless(VARIANT_FORMATS, 'Pillow has no WebP or AVIF support')
+    def test_variant_renditions(self):
+        image = Image.objects.create(category=self.category, photo=make_photo())
+        sources = image.rendition_sources('thumbnail')
+        self.assertEqual(
+            [mime_type for mime_type, _ in sources],
+            [mime_type for _, mime_type, _ in VARIANT_FORMATS]
+        )
+        for format, _, _ in VARIANT_FORMATS:
+            rendition = image.rendition_file('thumbnail', format)
+            self.assertNotEqual(
+                rendition.name, image.rendition_file('thumbnail').name
+            )
+            rendition.generate()
+            variant = PILImage.open(rendition.path)
+            self.assertEqual(variant.format, format)
+            self.assertLessEqual(max(variant.size), 320)
+
+        resp = self.client.get(
+            reverse('gallery:category', args=[self.category.slug])
+        )
+        for mime_type, srcset in image.variant_srcsets():
+            self.assertIn(url_of(srcset), [url for _, url in sources])
+            self.assertIn(
+                '<source type="{}" srcset="{}"'.format(mime_type, srcset),
+                resp.rendered_content
+            )
+
+    def test_no_variants_for_unreadable_file(self):
+        file = NamedTemporaryFile(suffix='.jpg', dir=self.media_root)
+        image = mommy.make(Image, photo=file.name, category=self.category)
+        self.assertEqual(image.rendition_sources('thumbnail'), [])
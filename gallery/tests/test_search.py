@@ -0,0 +1,103 @@
+from model_mommy import mommy
+
+from unittest import skipUnless
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from gallery.models import Category, Image
+from gallery.search import drop_sqlite_triggers, ensure_sqlite_triggers, \
+    search_images
+from gallery.tests.helpers import set_up_fb
+
+
+@override_settings(MEDIA_ROOT='/tmp/')
+class SearchTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.beach = mommy.make(Category, name='Beach party')
+        self.garden = mommy.make(
+            Category, name='Garden', description='Flowers in spring'
+        )
+        self.sunset = mommy.make(
+            Image, category=self.beach, caption='Sunset over the water'
+        )
+        self.dancing = mommy.make(
+            Image, category=self.beach, caption='Dancing'
+        )
+        self.roses = mommy.make(
+            Image, category=self.garden, caption='Red roses at sunset'
+        )
+
+    def _search(self, query):
+        return set(search_images(Image.objects.all(), query))
+
+    def test_searches_captions(self):
+        self.assertEqual(self._search('sunset'), {self.sunset, self.roses})
+        self.assertEqual(self._search('roses sunset'), {self.roses})
+        self.assertEqual(self._search('zebra'), set())
+        self.assertEqual(self._search('  "*" '), set())
+
+    def test_searches_album_names_and_descriptions(self):
+        self.assertEqual(self._search('beach'), {self.sunset, self.dancing})
+        self.assertEqual(self._search('flowers'), {self.roses})
+
+    def test_index_follows_changes(self):
+        self.dancing.caption = 'Dancing at sunset'
+        self.dancing.save()
+        self.assertIn(self.dancing, self._search('sunset'))
+
+        self.garden.name = 'Allotment'
+        self.garden.save()
+        self.assertEqual(self._search('allotment'), {self.roses})
+        self.assertEqual(self._search('garden'), set())
+
+        self.roses.category = self.beach
+        self.roses.save()
+        self.assertIn(self.roses, self._search('beach'))
+
+        self.sunset.delete()
+        self.assertEqual(self._search('water'), set())
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite search index')
+    def test_sqlite_triggers_recreated(self):
+        # as migrations that rebuild gallery_image do
+        drop_sqlite_triggers(connection)
+        Image.objects.filter(id=self.dancing.id).update(
+            caption='Dancing at sunset'
+        )
+        ensure_sqlite_triggers(connection)
+        # reindexed, and kept up to date again
+        self.assertIn(self.dancing, self._search('sunset'))
+        self.roses.caption = 'Tulips'
+        self.roses.save()
+        self.assertEqual(self._search('tulips'), {self.roses})
+
+    def test_search_view(self):
+        url = reverse('gallery:search')
+        resp = self.client.get(url, {'q': 'sunset'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            set(resp.context['images']), {self.sunset, self.roses}
+        )
+
+        resp = self.client.get(url, {'q': 'garden'})
+        self.assertEqual(list(resp.context['categories']), [self.garden])
+
+        resp = self.client.get(url)
+        self.assertEqual(list(resp.context['images']), [])
+
+    @override_settings(GALLERY_PAGE_SIZE=1)
+    def test_search_pages(self):
+        resp = self.client.get(reverse('gallery:search'), {'q': 'sunset'})
+        self.assertEqual(list(resp.context['images']), [self.sunset])
+
+        resp = self.client.get(
+            reverse('gallery:image_page'),
+            {'q': 'sunset', 'after': resp.context['next_cursor']}
+        )
+        self.assertEqual(
+            [image['id'] for image in resp.json()['images']], [self.roses.id]
+        )
@@ -0,0 +1,72 @@
+import os
+
+from mock import patch
+from model_mommy import mommy
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils.six import StringIO
+
+from gallery.models import Category, Image
+from gallery.storage import ContentAddressedStorage, is_content_addressed
+from gallery.tests.helpers import make_photo, set_up_fb, use_temp_media_root
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='storage')
+        self.other_category = mommy.make(Category, name='other')
+
+    def test_identical_content_is_stored_once(self):
+        storage = ContentAddressedStorage()
+        name = storage.save('gallery/a.jpg', ContentFile(b'photo'))
+        other_name = storage.save('gallery/b.JPG', ContentFile(b'photo'))
+        self.assertEqual(name, other_name)
+        self.assertTrue(is_content_addressed(name))
+        self.assertNotEqual(
+            storage.save('gallery/c.jpg', ContentFile(b'other photo')), name
+        )
+
+    def test_reuse_holds_photo_files_lock(self):
+        storage = ContentAddressedStorage()
+        name = storage.save('gallery/a.jpg', ContentFile(b'photo'))
+        with patch('gallery.storage.lock_photo_files') as lock:
+            self.assertEqual(
+                storage.save('gallery/b.jpg', ContentFile(b'photo')), name
+            )
+        # taken before checking the file exists, so a deletion can't
+        # remove it before the image reusing it is saved
+        self.assertTrue(lock.called)
+
+    def test_storage_report(self):
+        Image.objects.create(category=self.category, photo=make_photo())
+        Image.objects.create(category=self.other_category, photo=make_photo())
+        out = StringIO()
+        call_command('gallery_storage_report', stdout=out)
+        self.assertIn('2 images, 1 photo files (0 missing)', out.getvalue())
+
+
+class SharedPhotoDeletionTests(TransactionTestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='storage')
+        self.other_category = mommy.make(Category, name='other')
+
+    def test_shared_photo_deleted_with_last_image(self):
+        image = Image.objects.create(category=self.category, photo=make_photo())
+        duplicate = Image.objects.create(
+            category=self.other_category, photo=make_photo()
+        )
+        self.assertEqual(image.photo.name, duplicate.photo.name)
+        path = image.photo.path
+
+        image.delete()
+        self.assertTrue(os.path.exists(path))
+        duplicate.delete()
+        self.assertFalse(os.path.exists(path))
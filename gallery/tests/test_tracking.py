@@ -0,0 +1,62 @@
+import os
+
+from model_mommy import mommy
+
+from django.test import TestCase, TransactionTestCase
+
+from gallery.models import Category, Image
+from gallery.tests.helpers import make_photo, make_solid_photo, set_up_fb, \
+    use_temp_media_root
+
+
+class TrackedFieldsTests(TestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='tracking')
+        mommy.make(Image, category=self.category, caption='caption')
+
+    def test_loaded_values(self):
+        image = Image.objects.get()
+        self.assertEqual(image.get_loaded_value('category'), self.category.id)
+        self.assertFalse(image.has_field_changed('photo'))
+        self.assertFalse(image.has_field_changed('category'))
+
+        image.category = mommy.make(Category, name='other')
+        self.assertTrue(image.has_field_changed('category'))
+        image.save()
+        self.assertFalse(image.has_field_changed('category'))
+
+    def test_new_instance_fields_are_changed(self):
+        image = Image(category=self.category)
+        self.assertIsNone(image.get_loaded_value('photo'))
+        self.assertTrue(image.has_field_changed('photo'))
+
+    def test_caption_edit_does_not_select_image(self):
+        image = Image.objects.get()
+        image.caption = 'new caption'
+        # update the image and the category's images_updated_at only
+        with self.assertNumQueries(2):
+            image.save()
+
+
+class ReplacedPhotoDeletionTests(TransactionTestCase):
+
+    def setUp(self):
+        set_up_fb()
+        self.media_root = use_temp_media_root(self)
+        self.category = mommy.make(Category, name='replace')
+
+    def test_replaced_photo_deleted_after_commit(self):
+        Image.objects.create(
+            category=self.category, photo=make_solid_photo('red')
+        )
+        image = Image.objects.get()
+        old_path = image.photo.path
+        self.assertTrue(os.path.exists(old_path))
+
+        image.photo = make_photo()
+        image.save()
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(image.photo.path))
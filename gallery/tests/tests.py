@@ -1,19 +1,27 @@
 import os
+import re
 
+from mock import patch
 from model_mommy import mommy
 
 from tempfile import NamedTemporaryFile
 
 from django.conf import settings
-from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test import Client, RequestFactory, TestCase, \
+    TransactionTestCase, override_settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.messages.storage.fallback import FallbackStorage
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.html import strip_tags
 
+from activitylog.models import ActivityLog
+
 from gallery.models import Category, Image
-from gallery.tests.helpers import set_up_fb, _create_session
+from gallery.tests.helpers import make_solid_photo, set_up_fb, \
+    _create_session
 from gallery.views import CategoryListView, CategoryUpdateView, view_gallery
 
 
@@ -32,7 +40,7 @@ def format_content(content):
 
 
 @override_settings(MEDIA_ROOT='/tmp/')
-class GalleryModelTests(TestCase):
+class GalleryModelTests(TransactionTestCase):
 
     def setUp(self):
         set_up_fb()
@@ -220,7 +228,7 @@ class GalleryMainViewTests(TestCase):
         response = self.client.get(reverse('gallery:gallery'))
         self.assertEqual(response.status_code, 200)
         self.assertIn(
-            settings.MEDIA_URL + testimg.photo.name,
+            testimg.rendition_url('thumbnail'),
             response.rendered_content,
         )
         os.unlink(file.name)
@@ -311,12 +319,14 @@ class CategoryDetailViewTests(TestCase):
         resp = self.client.get(url)
         self.assertEqual(resp.status_code, 200)
         self.assertIn('Test Cat Name', resp.rendered_content)
-        self.assertIn(settings.MEDIA_URL + image.photo.name, resp.rendered_content)
+        self.assertIn(
+            image.rendition_url('thumbnail'), resp.rendered_content
+        )
         os.unlink(file.name)
 
 
 @override_settings(MEDIA_ROOT='/tmp/')
-class CategoryListViewTests(TestCase):
+class CategoryListViewTests(TransactionTestCase):
 
     def setUp(self):
         set_up_fb()
@@ -613,6 +623,89 @@ class CategoryListViewTests(TestCase):
         self._post_response(self.staff_user, formset_data)
         self.assertEqual(Category.objects.count(), 0)
 
+    def test_create_categories_with_long_similar_names(self):
+        # the same up to the slug's 40 characters
+        names = ['Photos from the long weekend in the Lakes, {}'.format(month)
+                 for month in ('May', 'June')]
+        formset_data = {
+            'form-TOTAL_FORMS': 2,
+            'form-INITIAL_FORMS': 0,
+            'form-0-name': names[0],
+            'form-1-name': names[1],
+        }
+        self._post_response(self.staff_user, formset_data)
+        self.assertEqual(
+            sorted(Category.objects.values_list('name', flat=True)),
+            sorted(names)
+        )
+        self.assertEqual(
+            len(set(Category.objects.values_list('slug', flat=True))), 2
+        )
+
+    def test_rename_many_categories_in_few_queries(self):
+        categories = [
+            mommy.make(Category, name='category{}'.format(i))
+            for i in range(50)
+        ]
+        formset_data = {
+            'form-TOTAL_FORMS': 51,
+            'form-INITIAL_FORMS': 50,
+        }
+        for i, category in enumerate(categories):
+            formset_data.update({
+                'form-{}-id'.format(i): category.id,
+                'form-{}-name'.format(i): 'renamed{}'.format(i),
+                'form-{}-description'.format(i): 'description',
+            })
+        formset_data['form-50-name'] = 'new'
+        formset_data['form-50-description'] = 'description'
+
+        with CaptureQueriesContext(connection) as queries:
+            self._post_response(self.staff_user, formset_data)
+        # fetch the categories, update them, check the new one's slug is
+        # unique, create it, and log the changes (the test's session and
+        # transaction queries aside)
+        self.assertLessEqual(
+            len([query for query in queries.captured_queries
+                 if 'gallery_' in query['sql'] or
+                 'activitylog_' in query['sql']]),
+            5
+        )
+
+        self.assertEqual(
+            sorted(Category.objects.values_list('name', flat=True)),
+            sorted(['renamed{}'.format(i) for i in range(50)] + ['new'])
+        )
+        self.assertEqual(
+            set(Category.objects.values_list('description', flat=True)),
+            {'description'}
+        )
+        self.assertEqual(ActivityLog.objects.count(), 1)
+        log = ActivityLog.objects.get().log
+        self.assertIn("'category0' changed to 'renamed0'", log)
+        self.assertIn("Category 'new' has been created", log)
+
+    def test_failed_changes_are_rolled_back(self):
+        category = mommy.make(Category, name='category')
+        mommy.make(Category, name='other')
+        formset_data = {
+            'form-TOTAL_FORMS': 2,
+            'form-INITIAL_FORMS': 1,
+            'form-0-id': category.id,
+            'form-0-name': 'renamed',
+            'form-0-description': '',
+            'form-1-name': 'new',
+        }
+        with patch(
+            'gallery.views.ActivityLog.objects.create',
+            side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self._post_response(self.staff_user, formset_data)
+        category.refresh_from_db()
+        self.assertEqual(category.name, 'category')
+        self.assertEqual(Category.objects.count(), 2)
+
 
 @override_settings(MEDIA_ROOT='/tmp/')
 class CategoryUpdateViewTests(TestCase):
@@ -792,3 +885,63 @@ class CategoryUpdateViewTests(TestCase):
         self.assertEqual(self.category.images.count(), 0)
 
         os.unlink(copied_filepath)
+
+    def _selects(self, queries, table):
+        return [
+            query['sql'] for query in queries
+            if re.match(r'SELECT .* FROM "?{}"?( |$)'.format(table),
+                        query['sql'])
+        ]
+
+    def test_album_and_images_loaded_once(self):
+        for colour in ('red', 'green', 'blue'):
+            Image.objects.create(
+                category=self.category, photo=make_solid_photo(colour)
+            )
+
+        # the album, then its images, then the photos hashed since the
+        # duplicates index was last brought up to date and the images' near
+        # duplicates (the photos are alike), for their flags
+        with self.assertNumQueries(4):
+            response = self._get_response(self.staff_user, self.category.id)
+        with CaptureQueriesContext(connection) as queries:
+            response.render()
+        self.assertEqual(self._selects(queries, 'gallery_category'), [])
+        self.assertEqual(self._selects(queries, 'gallery_image'), [])
+
+        formset = response.context_data['image_formset']
+        self.assertIs(
+            formset.forms[0].instance.category,
+            response.context_data['category']
+        )
+
+    def test_post_loads_album_and_images_once(self):
+        images = [
+            Image.objects.create(
+                category=self.category, photo=make_solid_photo(colour)
+            )
+            for colour in ('red', 'green', 'blue')
+        ]
+        formset_data = {
+            'name': self.category.name,
+            'description': '',
+            'images-TOTAL_FORMS': 3,
+            'images-INITIAL_FORMS': 3,
+        }
+        for i, image in enumerate(images):
+            formset_data.update({
+                'images-{}-id'.format(i): image.id,
+                'images-{}-caption'.format(i): 'caption {}'.format(i),
+            })
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post_response(
+                self.staff_user, self.category.id, formset_data
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(self._selects(queries, 'gallery_category')), 1)
+        self.assertEqual(len(self._selects(queries, 'gallery_image')), 1)
+        self.assertEqual(
+            sorted(self.category.images.values_list('caption', flat=True)),
+            ['caption 0', 'caption 1', 'caption 2']
+        )
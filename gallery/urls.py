@@ -1,11 +1,24 @@
 from django.conf import settings
 from django.conf.urls import url
-from gallery.views import category_detail_view, CategoryListView, \
-    CategoryUpdateView, gallery_menu_view, view_gallery
+
+from gallery import api
+from gallery.views import category_detail_view, CategoryImportView, \
+    CategoryListView, CategoryUpdateView, gallery_menu_view, \
+    image_page_json, search_view, view_gallery
 
 urlpatterns = [
     url(r'^$', gallery_menu_view, name='gallery'),
     url(r'^album/(?P<slug>[\w-]+)$', category_detail_view, name='category'),
+    url(r'^search/$', search_view, name='search'),
+    # next page of images for infinite scrolling
+    url(r'^images/$', image_page_json, name='image_page'),
+    # read only json api
+    url(r'^api/v1/albums/$', api.album_list, name='api_albums'),
+    url(
+        r'^api/v1/albums/(?P<slug>[\w-]+)/$', api.album_detail,
+        name='api_album'
+    ),
+    url(r'^api/v1/images/(?P<pk>\d+)/$', api.image_detail, name='api_image'),
     ##### VIEWS FOR STAFF USER ONLY #####
     # Category list view, show all categories in list, allow  for edit of
     # name and delete of entire category, add new category, links to category
@@ -16,6 +29,11 @@ urlpatterns = [
         r'^albums/(?P<pk>\d+)$', CategoryUpdateView.as_view(),
         name='edit_category'
     ),
+    # Bulk import of a zip file of images into a category
+    url(
+        r'^albums/(?P<pk>\d+)/import$', CategoryImportView.as_view(),
+        name='import_images'
+    ),
 ]
 
 
@@ -13,3 +13,51 @@ class StaffUserMixin(object):
                 reverse(settings.PERMISSION_DENIED_URL)
             )
         return super(StaffUserMixin, self).dispatch(request, *args, **kwargs)
+
+
+class TrackedFieldsMixin(object):
+    """
+    Model mixin that remembers the values of the fields named in
+    `tracked_fields` as they were loaded from the database, so save() can
+    tell what has changed without querying for the stored row.
+
+    Values are only known for instances loaded from the database; for new
+    instances get_loaded_value() returns None and every tracked field
+    counts as changed.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(TrackedFieldsMixin, cls).from_db(
+            db, field_names, values
+        )
+        instance._store_loaded_values()
+        return instance
+
+    def _tracked_value(self, name):
+        field = self._meta.get_field(name)
+        # get_prep_value gives a comparable value, e.g. a file's name
+        # rather than the FieldFile
+        return field.get_prep_value(field.value_from_object(self))
+
+    def _store_loaded_values(self):
+        self._loaded_values = {
+            name: self._tracked_value(name)
+            for name in self.tracked_fields
+            # skip deferred fields, loading them would cost a query
+            if self._meta.get_field(name).attname in self.__dict__
+        }
+
+    def get_loaded_value(self, name):
+        return getattr(self, '_loaded_values', {}).get(name)
+
+    def has_field_changed(self, name):
+        loaded_values = getattr(self, '_loaded_values', {})
+        if name not in loaded_values:
+            return True
+        return loaded_values[name] != self._tracked_value(name)
+
+    def save(self, *args, **kwargs):
+        super(TrackedFieldsMixin, self).save(*args, **kwargs)
+        self._store_loaded_values()
@@ -1,18 +1,152 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, Max, Q, Sum, \
+    TextField, Value, When
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404
-from django.views.generic import CreateView, ListView, UpdateView, DeleteView
+from django.conf import settings
+from django.views.generic import CreateView, ListView, UpdateView, DeleteView, \
+    View
 from django.shortcuts import HttpResponseRedirect
 from django.core.urlresolvers import reverse
 from django.contrib import messages
 from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
+from django.utils.text import slugify
+from django.views.decorators.http import condition
 
 from activitylog.models import ActivityLog
 
-from gallery.forms import CategoryForm, CategoriesFormset, ImageFormset
+from gallery.analysis import COLOUR_NAMES
+from gallery.cache import cache_page_by_version, category_scopes, \
+    invalidate_pages, menu_scopes
+from gallery.duplicates import find_duplicates_of
+from gallery.forms import CategoryForm, CategoriesFormset, ImageFormset, \
+    ImportImagesForm
+from gallery.identity import get_identity_map
+from gallery.imagegenerators import RENDITIONS
+from gallery.importer import import_images, queue_images
 from gallery.models import Category, Image
+from gallery.pagination import InvalidCursor, paginate_images
+from gallery.search import search_images
 from gallery.utils import StaffUserMixin
 
 
+def _page_etag(request, *state):
+    """
+    ETag for a gallery page, from the request path, the user (the pages show
+    the user's name and staff links) and `state`, which should change
+    whenever the page's content does.
+    """
+    if len(messages.get_messages(request)):
+        return None  # don't 304 a page that has messages to show
+    user = request.user.pk if request.user.is_authenticated() else 'anon'
+    parts = (request.get_full_path(), user) + state
+    return hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+
+
+def _gallery_etag(request, *args, **kwargs):
+    # denormalised per-album totals, so this is a single aggregate query on
+    # the category table.  No Last-Modified for the pages covering every
+    # album, since deleting an album doesn't leave a later timestamp behind.
+    state = Category.objects.aggregate(
+        count=Count('id'),
+        image_count=Sum('image_count'),
+        updated_at=Max('updated_at'),
+        images_updated_at=Max('images_updated_at'),
+    )
+    return _page_etag(
+        request, state['count'], state['image_count'], state['updated_at'],
+        state['images_updated_at']
+    )
+
+
+def _category_state(request, slug):
+    # the ETag and Last-Modified functions both need this, so fetch it once
+    if not hasattr(request, '_gallery_category_state'):
+        request._gallery_category_state = Category.objects.filter(
+            slug=slug
+        ).annotate(max_image_id=Max('images__id')).values(
+            'id', 'image_count', 'max_image_id', 'images_updated_at',
+            'updated_at'
+        ).first()
+    return request._gallery_category_state
+
+
+def _category_etag(request, slug):
+    state = _category_state(request, slug)
+    if state is None:
+        return None
+    return _page_etag(
+        request, state['id'], state['image_count'], state['max_image_id'],
+        state['images_updated_at'], state['updated_at']
+    )
+
+
+def _category_last_modified(request, slug):
+    state = _category_state(request, slug)
+    if state is None or request.user.is_authenticated():
+        # logging in or out changes the page, but not the time
+        return None
+    return max(
+        filter(None, [state['updated_at'], state['images_updated_at']])
+    )
+
+
+def _warn_duplicates(request, images):
+    """
+    Warn about any of `images` (just uploaded) that look like photos
+    already in the gallery
+    """
+    for image, duplicates in find_duplicates_of(images).items():
+        messages.warning(
+            request,
+            'Picture {} looks like a duplicate of {}'.format(
+                image.filename,
+                ', '.join(
+                    '{} in "{}"'.format(duplicate.filename,
+                                        duplicate.category.name)
+                    for duplicate in duplicates
+                )
+            )
+        )
+
+
+def _flag_duplicates(images):
+    """
+    Set `duplicates` on each of `images` that looks like other photos in
+    the gallery, so the album edit page can flag them; images processed in
+    the background are only hashed (and so checked) after their upload
+    """
+    for image, duplicates in find_duplicates_of(images).items():
+        image.duplicates = duplicates
+
+
+def _filter_colour(request, images):
+    """
+    Filter images by the request's `colour` parameter, if it's one of the
+    COLOUR_NAMES.  Returns (images, colour).
+    """
+    colour = request.GET.get('colour', '')
+    if colour not in COLOUR_NAMES:
+        return images, ''
+    return images.filter(colour=colour), colour
+
+
+def _get_image_page(request, queryset):
+    try:
+        return paginate_images(
+            queryset.select_related('category'), request.GET.get('after')
+        )
+    except InvalidCursor:
+        raise Http404
+
+
+@condition(etag_func=_gallery_etag)
 def view_gallery(request):
     categories = Category.objects.all().order_by('name')
     category_choice = request.GET.getlist('category', ['All'])[0]
@@ -22,6 +156,7 @@ def view_gallery(request):
     else:
         images = Image.objects.filter(category__id=int(category_choice))
         cat_selection = Category.objects.get(id=int(category_choice))
+    page = _get_image_page(request, images)
 
     return render(
         request,
@@ -29,14 +164,17 @@ def view_gallery(request):
         {
             'cat_selection': cat_selection,
             'categories': categories,
-            'images': images,
+            'images': page.object_list,
+            'next_cursor': page.next_cursor,
             'total_image_count': Image.objects.all().count()
         }
     )
 
 
+@condition(etag_func=_gallery_etag)
+@cache_page_by_version(menu_scopes)
 def gallery_menu_view(request):
-    categories = Category.objects.all().order_by('name')
+    categories = Category.objects.for_menu()
     return TemplateResponse(
         request,
         'gallery/gallery_menu.html',
@@ -46,19 +184,156 @@ def gallery_menu_view(request):
     )
 
 
+@condition(
+    etag_func=_category_etag, last_modified_func=_category_last_modified
+)
+@cache_page_by_version(category_scopes)
 def category_detail_view(request, slug):
 
     category = get_object_or_404(Category, slug=slug)
+    images, colour = _filter_colour(request, category.images.all())
+    page = _get_image_page(request, images)
     return TemplateResponse(
         request,
         'gallery/gallery_category.html',
         {
             'category': category,
-            'images': category.images.all()
+            'colour': colour,
+            'colours': COLOUR_NAMES,
+            'images': page.object_list,
+            'next_cursor': page.next_cursor,
         }
     )
 
 
+# results can include any image or album, so cache them under the menu's
+# version, which every change bumps
+@cache_page_by_version(menu_scopes)
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    images, colour = _filter_colour(request, Image.objects.all())
+    categories = Category.objects.none()
+    if query:
+        images = search_images(images, query)
+        categories = Category.objects.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        ).order_by('name')
+    elif not colour:
+        images = Image.objects.none()
+    page = _get_image_page(request, images)
+    return TemplateResponse(
+        request,
+        'gallery/gallery_search.html',
+        {
+            'query': query,
+            'colour': colour,
+            'colours': COLOUR_NAMES,
+            'categories': categories,
+            'images': page.object_list,
+            'next_cursor': page.next_cursor,
+        }
+    )
+
+
+def image_page_json(request):
+    """
+    The next page of images as json, for infinite scrolling of the album
+    and search pages.  Takes an optional `category` id, search query `q` and
+    `colour`, and the `after` cursor returned with the previous page.
+    """
+    images = Image.objects.all()
+    if request.GET.get('category'):
+        try:
+            images = images.filter(category_id=int(request.GET['category']))
+        except ValueError:
+            raise Http404
+    if request.GET.get('q'):
+        images = search_images(images, request.GET['q'])
+    images, _ = _filter_colour(request, images)
+    page = _get_image_page(request, images)
+
+    return JsonResponse(
+        {
+            'images': [
+                dict(
+                    {
+                        'id': image.id,
+                        'caption': image.caption or '',
+                        'category': image.category.name,
+                        'placeholder': image.placeholder,
+                        'width': image.width,
+                        'height': image.height,
+                        # smaller format variants of each rendition
+                        'sources': {
+                            name: [
+                                {'type': mime_type, 'url': url}
+                                for mime_type, url
+                                in image.rendition_sources(name)
+                            ]
+                            for name, _ in RENDITIONS
+                        },
+                        # every rendition, for the browser to choose from
+                        'srcset': image.rendition_srcset(),
+                        'variant_srcsets': [
+                            {'type': mime_type, 'srcset': srcset}
+                            for mime_type, srcset in image.variant_srcsets()
+                        ],
+                    },
+                    **{name: image.rendition_url(name)
+                       for name, _ in RENDITIONS}
+                )
+                for image in page
+            ],
+            'next_cursor': page.next_cursor,
+        }
+    )
+
+
+def _update_categories(categories):
+    """
+    Save the names and descriptions of edited categories in one UPDATE
+    """
+    ids = [category.id for category in categories]
+    Category.objects.filter(id__in=ids).update(
+        name=Case(
+            *[When(id=category.id, then=Value(category.name))
+              for category in categories],
+            output_field=CharField()
+        ),
+        description=Case(
+            *[When(id=category.id, then=Value(category.description))
+              for category in categories],
+            output_field=TextField()
+        ),
+        updated_at=timezone.now()
+    )
+    # bypasses the post_save receiver; slugs don't change with the names
+    invalidate_pages(ids)
+
+
+def _create_categories(categories):
+    # AutoSlugField only makes each slug unique among the saved categories,
+    # so categories whose slugs would clash are saved one at a time.  It
+    # cuts slugs to the field's length, so names that only differ after
+    # that clash too.
+    max_length = Category._meta.get_field('slug').max_length
+    slugs = [
+        slugify(category.name)[:max_length].strip('-')
+        for category in categories
+    ]
+    if len(set(slugs)) == len(slugs):
+        try:
+            with transaction.atomic():
+                Category.objects.bulk_create(categories)
+        except IntegrityError:
+            pass  # e.g. a category with one of the slugs was just created
+        else:
+            invalidate_pages()
+            return
+    for category in categories:
+        category.save()
+
+
 class CategoryListView(StaffUserMixin, ListView):
 
     model = Category
@@ -73,105 +348,100 @@ class CategoryListView(StaffUserMixin, ListView):
     def post(self, request, *args, **kwargs):
         categories_formset = CategoriesFormset(request.POST)
 
-        if categories_formset.is_valid():
-            if categories_formset.has_changed():
-
-                deleted_categories = []
-                updated_categories = {}
-                new_categories = []
-                update_desc_msg = ""
-
-                for form in categories_formset:
-                    if form.is_valid():
-                        if form.has_changed():
-                            if 'DELETE' in form.changed_data:
-                                category = Category.objects.get(id=form.instance.id)
-                                deleted_categories.append(category.name)
-                                category.delete()
-                            else:
-                                new = False
-                                try:
-                                    new_cat = form.save(commit=False)
-                                    old_cat = Category.objects.get(id=new_cat.id)
-                                except Category.DoesNotExist:  # creating a new category
-                                    new = True
-
-                                if 'name' in form.changed_data:
-                                    if not new:
-                                        old_name = old_cat.name
-                                        new_name = new_cat.name
-                                        updated_categories[new_cat.id] = [old_name, new_name]
-                                    else:
-                                        new_categories.append(new_cat.name)
-                                elif 'description' in form.changed_data:
-                                    if not new:
-                                        update_desc_msg = "Category {}'s description " \
-                                                          "has been updated".format(
-                                            new_cat.name
-                                        )
-                                form.save()
-
-                del_msg = ""
-                upd_msg = ""
-                new_msg = ""
-
-                if len(deleted_categories) == 1:
-                    del_msg = "Category '{}' and all associated images have been " \
-                          "deleted".format(deleted_categories[0])
-                elif len(deleted_categories) > 1:
-                    del_msg = "Categories {} and all associated images have been " \
-                          "deleted".format(
-                        ', '.join(["'{}'".format(name) for name in deleted_categories])
-                    )
-                if updated_categories:
-                    upd_msg = "Category names changed: {}".format(
-                        ', '.join(
-                            ["'{}' changed to '{}'".format(val[0], val[1])
-                             for key, val in updated_categories.items()]
-                        )
-                    )
-                if len(new_categories) == 1:
-                    new_msg = "Category '{}' has been created".format(new_categories[0])
-                elif len(new_categories) > 1:
-                    del_msg = "Categories {} have been created".format(
-                        ', '.join(["'{}'".format(name) for name in new_categories])
-                    )
-
-                messages.success(
-                    request,
-                    mark_safe(
-                        "{}{}{}".format(
-                            "{}</br>".format(del_msg) if del_msg else "",
-                            "{}</br>".format(upd_msg) if upd_msg else "",
-                            "{}</br>".format(update_desc_msg) if update_desc_msg else "",
-                            "{}".format(new_msg)
-                        )
-                    )
+        if not categories_formset.is_valid():
+            messages.error(request, "Please correct the errors below")
+            return TemplateResponse(
+                request, self.template_name,
+                {'categories_formset': categories_formset}
+            )
+        if not categories_formset.has_changed():
+            messages.info(request, "No changes made")
+            return HttpResponseRedirect(self.get_success_url())
+
+        # The formset fetched every existing category in a single query.
+        # Each form's instance has the posted changes applied to it, and
+        # its initial data still has the values from before the changes.
+        deleted = []
+        renamed = []
+        described = []
+        created = []
+        for form in categories_formset:
+            if not form.has_changed():
+                continue
+            if form.cleaned_data.get('DELETE'):
+                if form.instance.id:
+                    deleted.append(form.instance)
+            elif form.instance.id is None:
+                created.append(form.instance)
+            elif 'name' in form.changed_data:
+                renamed.append((form.initial['name'], form.instance))
+            else:
+                described.append(form.instance)
+
+        with transaction.atomic():
+            if deleted:
+                # a queryset delete still sends the delete signals, which
+                # clean up the images' files and the cached pages
+                Category.objects.filter(
+                    id__in=[category.id for category in deleted]
+                ).delete()
+            if renamed or described:
+                _update_categories(
+                    [category for _, category in renamed] + described
                 )
-
-                if del_msg:
-                    ActivityLog.objects.create(
-                        log=del_msg + 'by admin user {}'.format(request.user)
+            if created:
+                _create_categories(created)
+
+            del_msg = ""
+            upd_msg = ""
+            new_msg = ""
+            if len(deleted) == 1:
+                del_msg = "Category '{}' and all associated images have " \
+                          "been deleted".format(deleted[0].name)
+            elif len(deleted) > 1:
+                del_msg = "Categories {} and all associated images have " \
+                          "been deleted".format(
+                    ', '.join(
+                        ["'{}'".format(category.name) for category in deleted]
                     )
-                if upd_msg:
-                    ActivityLog.objects.create(
-                        log=upd_msg + 'by admin user {}'.format(request.user)
+                )
+            if renamed:
+                upd_msg = "Category names changed: {}".format(
+                    ', '.join(
+                        ["'{}' changed to '{}'".format(old_name, category.name)
+                         for old_name, category in renamed]
                     )
-                if new_msg:
-                    ActivityLog.objects.create(
-                        log=new_msg + 'by admin user {}'.format(request.user)
+                )
+            desc_msgs = [
+                "Category {}'s description has been updated".format(
+                    category.name
+                )
+                for category in described
+            ]
+            if len(created) == 1:
+                new_msg = "Category '{}' has been created".format(
+                    created[0].name
+                )
+            elif len(created) > 1:
+                new_msg = "Categories {} have been created".format(
+                    ', '.join(
+                        ["'{}'".format(category.name) for category in created]
                     )
+                )
 
-            else:
-                messages.info(request, "No changes made")
-
-        else:
-            messages.error(request, "Please correct the errors below")
-            return TemplateResponse(
-                request, self.template_name,
-                {'categories_formset': categories_formset}
+            change_msgs = [del_msg, upd_msg] + desc_msgs + [new_msg]
+            messages.success(
+                request, mark_safe('</br>'.join(filter(None, change_msgs)))
             )
 
+            log_msgs = list(filter(None, [del_msg, upd_msg, new_msg]))
+            if log_msgs:
+                ActivityLog.objects.create(
+                    log='{} by admin user {}'.format(
+                        '; '.join(log_msgs), request.user
+                    )
+                )
+
         return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
@@ -186,22 +456,34 @@ class CategoryUpdateView(StaffUserMixin, UpdateView):
     form_class = CategoryForm
 
     def get_object(self):
-        queryset = Category.objects.all()
-        return get_object_or_404(queryset, id=self.kwargs['pk'])
+        try:
+            return get_identity_map(self.request).get(
+                Category, self.kwargs['pk']
+            )
+        except Category.DoesNotExist:
+            raise Http404
+
+    def get_image_formset(self, *args):
+        """
+        The album's image formset, with its images (fetched in one query)
+        registered in the request's identity map
+        """
+        image_formset = ImageFormset(*args, instance=self.get_object())
+        get_identity_map(self.request).add_all(image_formset.get_queryset())
+        return image_formset
 
     def get_context_data(self, **kwargs):
         context = super(CategoryUpdateView, self).get_context_data(**kwargs)
 
-        picture_formset = ImageFormset(instance=self.get_object())
-        context['image_formset'] = picture_formset
+        context['image_formset'] = self.get_image_formset()
+        _flag_duplicates(context['image_formset'].get_queryset())
+        context['import_form'] = ImportImagesForm()
         return context
 
     def post(self, request, *args, **kwargs):
-        category = Category.objects.get(id=self.kwargs['pk'])
+        category = self.get_object()
         form = CategoryForm(request.POST, instance=category)
-        image_formset = ImageFormset(
-            request.POST, request.FILES, instance=category
-        )
+        image_formset = self.get_image_formset(request.POST, request.FILES)
 
         if form.is_valid() and image_formset.is_valid():
 
@@ -209,6 +491,7 @@ class CategoryUpdateView(StaffUserMixin, UpdateView):
             deleted_pics = []
             new_pics = []
             edited_pics = []
+            uploaded_images = []
 
             if image_formset.has_changed():
                 for form in image_formset.forms:
@@ -216,30 +499,30 @@ class CategoryUpdateView(StaffUserMixin, UpdateView):
                         image = form.save(commit=False)
 
                         if 'DELETE' in form.changed_data:
-                            name = image.photo.name
+                            name = image.filename
                             image.delete()
                             change_messages.append(
                                 'Picture {} deleted from "{}" category'.format(
-                                    name.split('/')[-1],
+                                    name,
                                     category.name.title()
                                 )
                             )
-                            deleted_pics.append(name.split('/')[-1])
+                            deleted_pics.append(name)
                         elif form.has_changed():
                             action = 'edited' if image.id else 'added'
                             image.save()
+                            if 'photo' in form.changed_data:
+                                uploaded_images.append(image)
                             change_messages.append(
                                 'Picture {} has been {}'.format(
-                                    image.photo.name.split('/')[-1],
+                                    image.filename,
                                     action
                                 )
                             )
                             if action == 'edited':
-                                edited_pics.append(
-                                    image.photo.name.split('/')[-1]
-                                )
+                                edited_pics.append(image.filename)
                             else:
-                                new_pics.append(image.photo.name.split('/')[-1])
+                                new_pics.append(image.filename)
                     else:
                         for error in form.errors:
                             messages.error(request, mark_safe(error))
@@ -254,6 +537,8 @@ class CategoryUpdateView(StaffUserMixin, UpdateView):
                     )
                 )
 
+                _warn_duplicates(request, uploaded_images)
+
                 if new_pics:
                     ActivityLog.objects.create(
                         log='Pictures added to Gallery category {} by admin '
@@ -297,3 +582,52 @@ class CategoryUpdateView(StaffUserMixin, UpdateView):
 
     def get_success_url(self):
         return reverse('gallery:categories')
+
+
+class CategoryImportView(StaffUserMixin, View):
+    """
+    Bulk import of a zip file of images into an album.  With deferred
+    processing on, the images are queued for the process_gallery_images
+    worker; otherwise they are encoded here, in the request's own process
+    (forking a pool from a web server worker isn't safe).  Very large
+    imports are better done with the import_gallery_images management
+    command, which encodes across a pool.
+    """
+
+    def post(self, request, *args, **kwargs):
+        category = get_object_or_404(Category, id=self.kwargs['pk'])
+        form = ImportImagesForm(request.POST, request.FILES)
+
+        if form.is_valid():
+            archive = form.cleaned_data['archive']
+            last_id = category.images.aggregate(last_id=Max('id'))['last_id']
+            if settings.GALLERY_DEFER_PROCESSING:
+                stats = queue_images(category, archive)
+                message = '{} picture(s) from {} queued for processing'
+            else:
+                stats = import_images(category, archive, processes=1)
+                message = '{} picture(s) imported from {}'
+            message = message.format(stats.imported, archive.name)
+            if stats.failed:
+                message += '; could not import {}'.format(
+                    ', '.join(stats.failed)
+                )
+            messages.success(request, message)
+            # queued images are hashed once they're processed; the album
+            # page then flags any duplicates (see _flag_duplicates)
+            if not settings.GALLERY_DEFER_PROCESSING:
+                _warn_duplicates(
+                    request, category.images.filter(id__gt=last_id or 0)
+                )
+            ActivityLog.objects.create(
+                log='{} to Gallery category {} by admin user {}'.format(
+                    message, category.name, request.user
+                )
+            )
+        else:
+            for error in form.errors.get('archive', []):
+                messages.error(request, error)
+
+        return HttpResponseRedirect(
+            reverse('gallery:edit_category', args=[category.id])
+        )
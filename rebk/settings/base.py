@@ -11,13 +11,16 @@ import dj_database_url
 import environ
 import os
 
+from rebk.static import add_immutable_header
+
 root = environ.Path(__file__) - 3  # two folders back (/a/b/ - 3 = /)
 
 env = environ.Env(DEBUG=(bool, False),
                   PAYPAL_TEST=(bool, False),
                   USE_MAILCATCHER=(bool, False),
                   HEROKU=(bool, False),
-                  BOOKING_ON=(bool, False)
+                  BOOKING_ON=(bool, False),
+                  TESTING=(bool, False)
                   )
 
 environ.Env.read_env(root('rebk/.env'))  # reading .env file
@@ -174,6 +177,8 @@ USE_L10N = True
 USE_TZ = True
 
 HEROKU = env('HEROKU')
+# set when running the test suite (see .travis.yml)
+TESTING = env('TESTING')
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.7/howto/static-files/
 STATICFILES_DIRS = (root('static'),)
@@ -182,9 +187,28 @@ STATIC_URL = '/static/'
 STATIC_ROOT = root('collected-static')
 if HEROKU:
     STATIC_ROOT = 'staticfiles'
+# collectstatic writes content hashed file names, plus gzip and brotli
+# compressed copies; whitenoise (see rebk/wsgi.py) serves the compressed
+# copy the browser accepts, with far future, immutable expiry headers
+STATICFILES_STORAGE = \
+    'whitenoise.storage.CompressedManifestStaticFilesStorage'
+if TESTING:
+    # tests don't run collectstatic, so there's no manifest
+    STATICFILES_STORAGE = \
+        'django.contrib.staticfiles.storage.StaticFilesStorage'
+WHITENOISE_ADD_HEADERS_FUNCTION = add_immutable_header
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = root('media')
+# media is served by rebk.views.serve_media, which hands the transfer back
+# to the front end server if MEDIA_OFFLOAD is 'x-accel-redirect' (nginx,
+# with MEDIA_X_ACCEL_PREFIX an internal location aliased to MEDIA_ROOT) or
+# 'x-sendfile' (apache mod_xsendfile, lighttpd), or streams it itself if
+# it's not set
+MEDIA_OFFLOAD = env('MEDIA_OFFLOAD', default=None)
+MEDIA_X_ACCEL_PREFIX = '/protected-media/'
+# media only staff users may download (unprocessed gallery uploads)
+MEDIA_PRIVATE_PREFIXES = ('gallery/uploads/',)
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_USE_TLS = True
@@ -254,6 +278,29 @@ if not HEROKU:
 
 # ####HEROKU#######
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # file based, so cached pages and their versions are shared by all of
+    # the web processes
+    'gallery': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': env(
+            'GALLERY_CACHE_LOCATION',
+            default=os.path.join(BASE_DIR, 'cache', 'gallery')
+        ),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+if TESTING:
+    # cached pages would outlive each test's database; tests of the page
+    # cache override CACHES with a locmem cache
+    CACHES['gallery'] = {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+
 # Honor the 'X-Forwarded-Proto' header for request.is_secure()
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
@@ -413,5 +460,23 @@ if HEROKU:
 
 # for gallery app
 PERMISSION_DENIED_URL = 'permission_denied'
-
-TESTING = False
\ No newline at end of file
+# composite each album's cover images into a single stored image for the
+# gallery menu
+GALLERY_COVER_COLLAGES = False
+# number of images per page on the album pages
+GALLERY_PAGE_SIZE = 40
+# store uploads unprocessed and leave the processing to the
+# process_gallery_images worker
+GALLERY_DEFER_PROCESSING = True
+# delete removed images' files in a background thread after the deleting
+# transaction commits, rather than before the response is returned
+GALLERY_DELETE_IN_BACKGROUND = False
+# serve the gallery menu and album pages to anonymous users from the
+# GALLERY_CACHE_ALIAS cache (see gallery.cache)
+GALLERY_CACHE_PAGES = True
+GALLERY_CACHE_ALIAS = 'gallery'
+# photos whose perceptual hashes differ in at most this many of their 64 bits
+# are reported as near-duplicates (see gallery.duplicates)
+GALLERY_DUPLICATE_DISTANCE = 6
+# seconds clients may reuse gallery api responses for without revalidating
+GALLERY_API_MAX_AGE = 60
@@ -0,0 +1,16 @@
+import re
+
+
+# the content hash ManifestStaticFilesStorage adds to file names, e.g.
+# gallery.55e7cbb9ba48.js (or gallery.55e7cbb9ba48.js.gz)
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+
+
+def add_immutable_header(headers, path, url):
+    """
+    Whitenoise headers function: hashed static files never change (a new
+    version gets a new name), so tell browsers not to revalidate them, even
+    on reload
+    """
+    if HASHED_NAME_RE.search(url):
+        headers['Cache-Control'] = 'public, max-age=315360000, immutable'
@@ -6,7 +6,7 @@ from django.conf.urls.static import static
 
 from accounts.views import CustomLoginView
 
-from .views import permission_denied
+from .views import permission_denied, serve_media
 
 urlpatterns = [
     url(r'^admin/', include(admin.site.urls)),
@@ -23,7 +23,9 @@ urlpatterns = [
     url(r'^favicon.ico/$',
         RedirectView.as_view(url=settings.STATIC_URL+'favicon.ico',
                              permanent=False)),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    url(r'^{}(?P<path>.+)$'.format(settings.MEDIA_URL.lstrip('/')),
+        serve_media, name='media'),
+]
 
 if settings.DEBUG:
     import debug_toolbar
@@ -1,5 +1,120 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, \
+    HttpResponseNotModified
 from django.shortcuts import render
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
 
 
 def permission_denied(request):
     return render(request, 'permission_denied.html')
+
+
+def _iter_range(path, start, length, chunk_size=64 * 1024):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _parse_range(header, size):
+    """
+    (start, end) of a single 'bytes=start-end' range, None if there's no
+    usable range, or False if it can't be satisfied
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        return None  # missing, or multiple ranges: send the whole file
+    start, end = match.groups()
+    if not start:  # the last `end` bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+    if start > end:
+        return False
+    return start, end
+
+
+def serve_media(request, path):
+    """
+    Serve a file from MEDIA_ROOT.  This only checks the file exists and the
+    user may see it; with settings.MEDIA_OFFLOAD set, the transfer itself is
+    handed back to the front end server with an X-Accel-Redirect (nginx) or
+    X-Sendfile (apache, lighttpd) header, so no worker time is spent
+    streaming it.  Otherwise the file is streamed from here, with support
+    for conditional and range requests.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    if path.startswith(settings.MEDIA_PRIVATE_PREFIXES) and \
+            not request.user.is_staff:
+        raise Http404
+    try:
+        fullpath = default_storage.path(path)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        stat = os.stat(fullpath)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    if settings.MEDIA_OFFLOAD == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = \
+            settings.MEDIA_X_ACCEL_PREFIX + path
+        return response
+    if settings.MEDIA_OFFLOAD == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+        return response
+
+    if not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'),
+            stat.st_mtime, stat.st_size
+    ):
+        return HttpResponseNotModified()
+
+    byte_range = _parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(stat.st_size)
+        return response
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(
+            _iter_range(fullpath, start, end - start + 1),
+            status=206, content_type=content_type
+        )
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(
+            start, end, stat.st_size
+        )
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(
+            open(fullpath, 'rb'), content_type=content_type
+        )
+        response['Content-Length'] = stat.st_size
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response